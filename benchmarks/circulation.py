@@ -0,0 +1,139 @@
+"""
+Benchmark of checkouts and returns under each database profile (see DB_PROFILES).
+Several desks (processes) lend and take back documents at the same time, on a copy of the database:
+each loan and each return is its own transaction, as at a desk.
+With --in-memory, the copy is loaded in memory, private to the benchmark process: desks work one after the other.
+Launch from the project root: python -m benchmarks.circulation [--desks 4] [--nb-of-copies 50] [PROFILES]...
+"""
+import sqlite3
+from datetime import date
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import typer
+from peewee import OperationalError
+
+from gere_ta_bib.models.copies import CopyBarcode
+from gere_ta_bib.models.transaction import Transaction
+from gere_ta_bib.models.users import User
+from gere_ta_bib.utils.constants import DB, DB_PROFILES
+from gere_ta_bib.utils.database import configure_database
+
+app = typer.Typer()
+
+
+def copy_database(source: str | Path, destination: str | Path) -> None:
+    """Copy a database with the SQLite backup API (consistent even if it is being written to, or in WAL mode)"""
+    source_connection, destination_connection = sqlite3.connect(source), sqlite3.connect(destination)
+    source_connection.backup(destination_connection)
+    source_connection.close()
+    destination_connection.close()
+
+
+def get_desks_workloads(nb_of_desks: int, nb_of_copies: int) -> list[tuple[str, list[str]]]:
+    """
+    Give each desk a user without loan and its own copies, neither borrowed nor returned today
+    (so that no loan is refused by the library rules)
+    """
+    busy_barcodes = (Transaction
+                     .select(Transaction.barcode)
+                     .where(Transaction.return_date.is_null() | (Transaction.return_date == date.today())))
+    barcodes = [barcode for barcode, in (CopyBarcode
+                                         .select(CopyBarcode.barcode)
+                                         .where(CopyBarcode.barcode.not_in(busy_barcodes))
+                                         .order_by(CopyBarcode.barcode)
+                                         .limit(nb_of_desks * nb_of_copies)
+                                         .tuples())]
+    borrowers = Transaction.select(Transaction.card_number).where(Transaction.return_date.is_null())
+    card_numbers = [card_number for card_number, in (User
+                                                     .select(User.card_number)
+                                                     .where(User.card_number.not_in(borrowers))
+                                                     .order_by(User.card_number)
+                                                     .limit(nb_of_desks)
+                                                     .tuples())]
+    if len(card_numbers) < nb_of_desks:
+        raise typer.BadParameter(f"Only {len(card_numbers)} users without loan for {nb_of_desks} desks.")
+    return [(card_number, barcodes[i::nb_of_desks]) for i, card_number in enumerate(card_numbers)]
+
+
+def lend_and_take_back(card_number: str, barcodes: list[str]) -> tuple[int, int]:
+    """Lend then take back each copy, one transaction at a time. Return the numbers of done and failed operations."""
+    done = failed = 0
+    for barcode in barcodes:
+        try:
+            Transaction.borrow_copy(card_number, barcode)
+            done += 1
+            Transaction.get((Transaction.barcode == barcode) & Transaction.return_date.is_null()).return_copy()
+            done += 1
+        except OperationalError:  # "database is locked": the busy timeout expired, the desk would have to retry
+            failed += 1
+    return done, failed
+
+
+def run_desk(path: str, profile: str, card_number: str, barcodes: list[str], start, results) -> None:
+    """Desk process: wait for the others, then lend and take back its copies"""
+    configure_database(path, profile)
+    start.wait()
+    results.put(lend_and_take_back(card_number, barcodes))
+    DB.close()
+
+
+def run_profile_in_memory(source: str | Path, profile: str, nb_of_desks: int,
+                          nb_of_copies: int) -> tuple[int, int, float]:
+    """Run the desks one after the other on a copy of the database in memory"""
+    configure_database(source, profile, in_memory=True)
+    workloads = get_desks_workloads(nb_of_desks, nb_of_copies)
+    start_time = perf_counter()
+    outcomes = [lend_and_take_back(card_number, barcodes) for card_number, barcodes in workloads]
+    duration = perf_counter() - start_time
+    return sum(done for done, _ in outcomes), sum(failed for _, failed in outcomes), duration
+
+
+def run_profile(source: str | Path, profile: str, nb_of_desks: int, nb_of_copies: int) -> tuple[int, int, float]:
+    """Run the desks on a fresh copy of the database. Return the numbers of done and failed operations, and time."""
+    context = get_context("spawn")
+    with TemporaryDirectory() as folder:
+        path = str(Path(folder) / "benchmark.db")
+        copy_database(source, path)
+        configure_database(path, profile)
+        workloads = get_desks_workloads(nb_of_desks, nb_of_copies)
+        DB.close()  # the journal mode of the profile is set, before the desks connect
+        start = context.Barrier(nb_of_desks + 1)
+        results = context.Queue()
+        desks = [context.Process(target=run_desk, args=(path, profile, card_number, barcodes, start, results))
+                 for card_number, barcodes in workloads]
+        for desk in desks:
+            desk.start()
+        start.wait()
+        start_time = perf_counter()
+        outcomes = [results.get() for _ in desks]
+        duration = perf_counter() - start_time
+        for desk in desks:
+            desk.join()
+    return sum(done for done, _ in outcomes), sum(failed for _, failed in outcomes), duration
+
+
+@app.command()
+def benchmark(profiles: list[str] = typer.Argument(None, help="Profiles to compare (all by default)"),
+              desks: int = typer.Option(4, help="Number of desks working at the same time"),
+              nb_of_copies: int = typer.Option(50, help="Copies lent then taken back by each desk"),
+              database: Path = typer.Option(None, exists=True, dir_okay=False,
+                                            help="Database to copy (the default database otherwise)"),
+              in_memory: bool = typer.Option(False, help="Copy the database in memory")) -> None:
+    """Compare checkout and return throughput of the database profiles"""
+    profiles = profiles or list(DB_PROFILES)
+    source = database or DB.obj.database
+    typer.echo(f"{desks} desk(s), {nb_of_copies} copies each, on a copy of {source}{" in memory" if in_memory else ""}")
+    typer.echo(f"{"profile":<10}{"operations":>12}{"locked":>8}{"seconds":>10}{"operations/s":>14}")
+    for profile in profiles:
+        if profile not in DB_PROFILES:
+            raise typer.BadParameter(f"Unknown profile {profile} (profiles: {", ".join(DB_PROFILES)}).")
+        done, failed, duration = (run_profile_in_memory if in_memory else run_profile)(source, profile, desks,
+                                                                                       nb_of_copies)
+        typer.echo(f"{profile:<10}{done:>12}{failed:>8}{duration:>10.2f}{done / duration:>14.1f}")
+
+
+if __name__ == '__main__':
+    app()
@@ -7,17 +7,34 @@ Date: septembre 2024
 Entry point
 """
 import sys
+from pathlib import Path
 
+import click
 import typer
 
 from gere_ta_bib.controllers.staff_controller import StaffController
 from gere_ta_bib.controllers.user_controller import UserController
+from gere_ta_bib.utils.constants import DB_PATH, DB_PROFILE, DB_PROFILES, DbEnvVars
+from gere_ta_bib.utils.database import configure_database
 from gere_ta_bib.views.cli.staff_cli_view import StaffCliView
 from gere_ta_bib.views.cli.user_cli_view import UserCliView
 
 app = typer.Typer()
 
 
+@app.callback()
+def configure(db_path: Path = typer.Option(DB_PATH, "--db-path", envvar=DbEnvVars.PATH, exists=True, dir_okay=False,
+                                           help="Database file"),
+              db_profile: str = typer.Option(DB_PROFILE, "--db-profile", envvar=DbEnvVars.PROFILE,
+                                             click_type=click.Choice(list(DB_PROFILES)),
+                                             help="SQLite settings of the database (see DB_PROFILES)"),
+              in_memory: bool = typer.Option(False, "--in-memory", envvar=DbEnvVars.IN_MEMORY,
+                                             help="Work on a copy of the database loaded in memory "
+                                                  "(faster, but changes are not saved)")) -> None:
+    """Set up the database, then launch the program for a standard user or a staff member"""
+    configure_database(db_path, db_profile, in_memory)
+
+
 @app.command("staff")
 def launch_staff_controller() -> None:
     """Launch program for a staff member"""
@@ -12,12 +12,15 @@ from gere_ta_bib.controllers.helpers import (get_reservations_from_card_number,
                                              get_notices_from_keywords,
                                              check_numeric_choice, exit_func, NOTICES_MODELS, is_reserved,
                                              get_first_reservation_from_barcode, is_reserved_by_self)
+from gere_ta_bib.controllers.maintenance import MAINTENANCE_SCHEDULER, configure_maintenance_log
+from gere_ta_bib.models.contributors import CONTRIBUTORS_MODELS
 from gere_ta_bib.models.copies import BaseCopy
+from gere_ta_bib.models.migrations import migrate
 from gere_ta_bib.models.notices import BaseNotice
 from gere_ta_bib.models.reservation import Reservation
-from gere_ta_bib.models.transaction import Transaction
-from gere_ta_bib.models.users import User
-from gere_ta_bib.utils.constants import NB_OF_RANDOM_NOTICES, QUIT_LETTER, ReservationStatuses, YES_NO
+from gere_ta_bib.models.search_index import build_completions
+from gere_ta_bib.models.transaction import Transaction, BorrowedCopy
+from gere_ta_bib.utils.constants import NB_OF_RANDOM_NOTICES, QUIT_LETTER, YES_NO
 from gere_ta_bib.utils.exceptions import CopyBorrowedTodayError, MaxNbOfRenewalsError, AlreadyBorrowedByOtherError, \
     AlreadyBorrowedBySelfError, ReturnedTodayError, MaxNbOfReservationsError, AlreadyReservedBySelfError, \
     MaxNbOfLoansError
@@ -80,22 +83,6 @@ class BaseController(ABC):
             self.view, self.actions, choice, self.view.goodbye
         )
 
-    @staticmethod
-    def daily_routine() -> None:
-        """Operations that must be done every day"""
-        # Set transactions overdue statuses
-        for transaction in Transaction.select().where(Transaction.return_date.is_null()):
-            transaction.set_overdue()
-
-        # Set reservations statuses
-        for reservation in Reservation.select().where(
-                Reservation.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE])):
-            reservation.set_status()
-
-        # Set users is_active statuses
-        for user in User.select():
-            user.set_is_active_status()
-
     def get_function_from_choice(self, actions: dict, choice: int) -> Callable:
         """Get function associated to choice"""
         return self.function_by_action.get(actions.get(choice))
@@ -112,7 +99,7 @@ class BaseController(ABC):
         """Handle the MaxNbOfLoansError based on view"""
         pass
 
-    def handle_max_nb_of_renewals(self, card_number: str, copy: BaseCopy) -> None:
+    def handle_max_nb_of_renewals(self, card_number: str, copy: BorrowedCopy) -> None:
         """Handle the MaxNbOfRenewalsError based on view"""
         pass
 
@@ -142,7 +129,7 @@ class BaseController(ABC):
                 except ValueError:
                     self.view.invalid_choice()
                     continue
-                copy: BaseCopy = list(borrowed)[num - 1]
+                copy: BorrowedCopy = list(borrowed)[num - 1]
                 transaction = Transaction.select().where((Transaction.barcode == copy.barcode)
                                                          & Transaction.return_date.is_null()).first()
                 try:
@@ -201,8 +188,11 @@ class BaseController(ABC):
             continue
 
     def run(self) -> None:
-        self.daily_routine()
+        configure_maintenance_log()
+        migrate()
+        build_completions(list(NOTICES_MODELS) + CONTRIBUTORS_MODELS)
         self.view.welcome()
+        MAINTENANCE_SCHEDULER.start()
         while True:
             action_num = self.choose_action()
             function = self.get_function_from_choice(self.actions, action_num)
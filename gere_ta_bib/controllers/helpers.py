@@ -1,21 +1,24 @@
 """Helpers for controllers"""
-import json
 import logging
 from datetime import date
 from functools import wraps
-from typing import Callable, NoReturn
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, NoReturn
 
-import unicodedata
-from peewee import ForeignKeyField, CharField
-
-from gere_ta_bib.models.contributors import Publisher, Musician, Director, Author, BaseArtist
-from gere_ta_bib.models.copies import BaseCopy, COPIES_MODELS, BookCopy, FilmCopy, MusicCopy
-from gere_ta_bib.models.notices import BaseNotice, NOTICES_MODELS, MusicNotice, BookNotice, FilmNotice
+from gere_ta_bib.controllers.importer import ARTISTS_FIELDS, DryRunReport, NoticesImporter, get_notices_files, \
+    import_notices_file
+from gere_ta_bib.models.copies import BaseCopy, BookCopy, FilmCopy, MusicCopy, CopyBarcode
+from gere_ta_bib.models.notices import BaseNotice, NOTICES_MODELS, MusicNotice, BookNotice, FilmNotice, EAN_RESOLVER
 from gere_ta_bib.models.reservation import Reservation
-from gere_ta_bib.models.transaction import Transaction
+from gere_ta_bib.models.search_fts import is_fts5_available, search_notices_fts
+from gere_ta_bib.models.search_index import search_notices, search_notices_fuzzy, get_notices_from_keys
+from gere_ta_bib.models.transaction import Transaction, BorrowedCopy
 from gere_ta_bib.models.users import User
-from gere_ta_bib.utils.constants import ValidExpressions, ReservationStatuses, QUIT_LETTER, DOC_TYPES
+from gere_ta_bib.utils.constants import ValidExpressions, ReservationStatuses, QUIT_LETTER, DOC_TYPES, \
+    GENRES_TO_REFS1, SEARCH_ENGINE, SearchEngines
 from gere_ta_bib.utils.exceptions import ExitFunction
+from gere_ta_bib.utils.notices_files import read_notices_file
+from gere_ta_bib.utils.text import get_normalized_words
 from gere_ta_bib.views.cli.base_cli_view import BaseCliView
 from gere_ta_bib.views.cli.staff_cli_view import StaffCliView
 
@@ -70,103 +73,93 @@ def check_user_account(func: Callable):
     return wrapper
 
 
+def check_notices_data(notice_model, path: str,
+                       progress: Callable[[int, int, int, int], None] | None = None) -> DryRunReport:
+    """
+    Check the notices of a file, or of all the notices files of a folder, without writing anything (dry run).
+    Records are read and checked as for an import, and also with the catalog rules (see get_record_problems).
+    New and existing notices are told apart with the EANs and contributors loaded once in memory.
+    :param progress: called regularly with the numbers of read records, new notices, existing notices and errors
+    """
+    importer = NoticesImporter(notice_model, dry_run=True)
+    nb_to_check = 0
+
+    def check_records(records: Iterable[dict | Exception]) -> Iterator[dict | Exception]:
+        """Log and count the records that don't follow the catalog rules"""
+        nonlocal nb_to_check
+        for record in records:
+            if isinstance(record, dict) and (problems := get_record_problems(notice_model, record)):
+                nb_to_check += 1
+                logging.warning(StaffCliView.InfoMessages.NOTICE_TO_CHECK.format(ean=record.get("ean"),
+                                                                                 problems=", ".join(problems)))
+            yield record
+
+    start = perf_counter()
+    for file in get_notices_files(path):
+        importer.import_records(check_records(read_notices_file(file, ARTISTS_FIELDS[notice_model])), progress)
+    return DryRunReport(nb_read=importer.nb_read, nb_new=importer.nb_new, nb_existing=importer.nb_existing,
+                        nb_errors=importer.nb_errors, nb_to_check=nb_to_check,
+                        nb_new_artists=len(importer.new_artists), nb_new_publishers=len(importer.new_publishers),
+                        duration=perf_counter() - start)
+
+
 def exit_func() -> NoReturn:
     """Raise a fake exception to simulate a return"""
     raise ExitFunction()
 
 
-def extract_books_data(file: str) -> tuple[int, int, int]:
+def extract_books_data(file: str, progress: Callable[[int, int, int, int], None] | None = None) \
+        -> tuple[int, int, int] | None:
     """
-    Extract books data from a json file and add them (if not already existing) in the database.
-    :param file: a sting with the path of the json file
-    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors)
+    Extract books data from a notices file (see NOTICES_FILES_READERS), read record by record,
+    and add them (if not already existing) in the database. An interrupted import of the file is resumed.
+    :param file: a sting with the path of the notices file
+    :param progress: called regularly with the numbers of read records, new notices, existing notices and errors
+    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors),
+    None if the file has already been imported
     """
-    with open(file, "r", encoding="utf-8") as f:
-        books_data = json.load(f)
-        nb_new = nb_existing = nb_errors = 0
-    for book_data in books_data:
-        try:
-            publisher = handle_publisher(book_data)
-            authors = handle_artists(book_data, "authors", Author)
-            new, existing = handle_book_notice(book_data, publisher, authors)
-            nb_new += new
-            nb_existing += existing
-        except Exception as e:
-            nb_errors += 1
-            logging.error(e)
-    return nb_new, nb_existing, nb_errors
-
-
-def extract_films_data(file: str):
+    return import_notices_file(BookNotice, file, progress)
+
+
+def extract_films_data(file: str, progress: Callable[[int, int, int, int], None] | None = None) \
+        -> tuple[int, int, int] | None:
     """
-    Extract films data from a json file and add them (if not already existing) in the database.
-    :param file: a sting with the path of the json file
-    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors)
+    Extract films data from a notices file (see NOTICES_FILES_READERS), read record by record,
+    and add them (if not already existing) in the database. An interrupted import of the file is resumed.
+    :param file: a sting with the path of the notices file
+    :param progress: called regularly with the numbers of read records, new notices, existing notices and errors
+    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors),
+    None if the file has already been imported
     """
-    with open(file, "r", encoding="utf-8") as f:
-        films_data = json.load(f)
-        nb_new = nb_existing = nb_errors = 0
-    for film_data in films_data:
-        try:
-            directors = handle_artists(film_data, "directors", Director)
-            new, existing = handle_film_notice(film_data, directors)
-            nb_new += new
-            nb_existing += existing
-        except Exception as e:
-            nb_errors += 1
-            logging.error(e)
-    return nb_new, nb_existing, nb_errors
+    return import_notices_file(FilmNotice, file, progress)
 
 
-def extract_musics_data(file: str):
+def extract_musics_data(file: str, progress: Callable[[int, int, int, int], None] | None = None) \
+        -> tuple[int, int, int] | None:
     """
-    Extract musics data from a json file and add them (if not already existing) in the database.
-    :param file: a sting with the path of the json file
-    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors)
+    Extract musics data from a notices file (see NOTICES_FILES_READERS), read record by record,
+    and add them (if not already existing) in the database. An interrupted import of the file is resumed.
+    :param file: a sting with the path of the notices file
+    :param progress: called regularly with the numbers of read records, new notices, existing notices and errors
+    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors),
+    None if the file has already been imported
     """
-    with open(file, "r", encoding="utf-8") as f:
-        musics_data = json.load(f)
-        nb_new = nb_existing = nb_errors = 0
-    for music_data in musics_data:
-        try:
-            musicians = handle_artists(music_data, "musicians", Musician)
-            new, existing = handle_music_notice(music_data, musicians)
-            nb_new += new
-            nb_existing += existing
-        except Exception as e:
-            nb_errors += 1
-            logging.error(e)
-    return nb_new, nb_existing, nb_errors
-
-
-def generate_unique_barcode() -> str:
-    """Generate a valid and unique barcode for a copy"""
-    barcodes = []
-    for model in COPIES_MODELS:
-        model_barcodes = [copy.barcode for copy in model.select()]
-        barcodes.extend(model_barcodes)
-    highest = max([int(barcode) for barcode in barcodes]) if barcodes else 0
-    return f"{(highest + 1):012d}"
-
-
-def get_borrowed_copies_dict(card_number: str) -> dict[BaseCopy, date]:
+    return import_notices_file(MusicNotice, file, progress)
+
+
+def get_borrowed_copies_dict(card_number: str) -> dict[BorrowedCopy, date]:
     """
     Get the list of all currently borrowed documents, and return_dates
     :param card_number: string with user's card number
-    :return: dict of borrowed documents with document copies as keys,
+    :return: dict of borrowed documents with borrowed copies (barcode, title, artists) as keys,
     and return dates as values
     """
-    borrowed = Transaction.select().where((Transaction.card_number == card_number)
-                                          & (Transaction.return_date.is_null()))
-    return {transaction.copy: transaction.due_date for transaction in borrowed}
+    return {copy: copy.due_date for copy in Transaction.get_borrowed_copies(card_number)}
 
 
 def get_copy_from_barcode(barcode: str) -> BaseCopy | None:
     """Get a copy from a barcode"""
-    for model in COPIES_MODELS:
-        copy = model.select().where(model.barcode == barcode).first()
-        if copy:
-            return copy
+    return CopyBarcode.get_copy(barcode)
 
 
 def get_copy_model_from_notice(notice: BaseNotice) -> BaseCopy | None:
@@ -197,10 +190,7 @@ def get_nb_of_overdues(card_number: str) -> int:
 
 def get_notice_from_ean(ean: str) -> BaseNotice | None:
     """Get a notice from an EAN"""
-    for model in NOTICES_MODELS:
-        for notice in model.select():
-            if notice.ean == ean:
-                return notice
+    return EAN_RESOLVER.get_notice(ean)
 
 
 def get_notice_from_barcode(barcode: str) -> BaseNotice:
@@ -208,36 +198,21 @@ def get_notice_from_barcode(barcode: str) -> BaseNotice:
     return get_copy_from_barcode(barcode).parent_notice
 
 
-def get_normalized_words(text: str) -> list:
+def get_notices_from_keywords(view, query: str) -> list[BaseNotice]:
     """
-    Convert to lowercase, remove diacritical marks and replace punctuation marks by spaces,
-    then return a list with normalized words.
-    >>> get_normalized_words("L'école à la plage, c'est une bonne idée !")
-    ['l', 'ecole', 'a', 'la', 'plage', 'c', 'est', 'une', 'bonne', 'idee']
+    Get (and display) all notices containing all the words of the query, using the search engine
+    chosen in constants (SEARCH_ENGINE). If there is no result, make a typo-tolerant search.
     """
-    text = remove_diacritical_marks(text.lower())
-    return "".join(char if char.isalnum() else " " for char in text).split()
-
-
-def get_notices_from_keywords(view, query: str) -> list[BaseNotice]:
     words = get_normalized_words(query)
-    notices = []
-    for model in NOTICES_MODELS:
-        for notice in model.select():
-            if word_is_in_charfields(words[0], notice):
-                notices.append(notice)
-
-    for word in words[1:]:
-        for notice in notices[::-1]:
-            word_found = False
-            i = len(notices[::-1])
-            while not word_found and i > 0:
-                if word_is_in_charfields(word, notice):
-                    word_found = True
-                i -= 1
-            if not word_found:
-                notices.remove(notice)
-    view.search_results(notices)
+    if SEARCH_ENGINE == SearchEngines.FTS5 and is_fts5_available():
+        notices = get_notices_from_keys(search_notices_fts(words), NOTICES_MODELS)
+    else:
+        notices = search_notices(words, NOTICES_MODELS)
+    if notices:
+        view.search_results(notices)
+    else:
+        notices = get_notices_from_keys(search_notices_fuzzy(words), NOTICES_MODELS)
+        view.search_results(notices, approximate=True)
     return notices
 
 
@@ -247,154 +222,15 @@ def get_user_from_card_number(card_number: str) -> User:
 
 
 def get_reservations_from_card_number(card_number: str) -> list[Reservation]:
-    """Get pending and available reservations from a card number"""
-    return list(Reservation.select().where(
+    """Get pending and available reservations from a card number, with their notices prefetched"""
+    return Reservation.prefetch_notices(list(Reservation.select().where(
         (Reservation.card_number == card_number) &
-        (Reservation.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE]))))
+        (Reservation.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE])))))
 
 
-def handle_publisher(book_data: dict) -> Publisher:
-    """Get publisher from book data, create it if not existing in database"""
-    publisher_name = book_data.get("publisher")
-    if not Publisher.select().where(Publisher.name == publisher_name).exists():
-        publisher = Publisher.create(name=publisher_name)
-    else:
-        publisher = Publisher.select().where(Publisher.name == publisher_name).first()
-    return publisher
-
-
-def handle_artists(notice_data: dict, artist_type: str, model: BaseArtist) -> list[BaseArtist]:
-    """Get artists from notice data, create them if not existing in database"""
-    artists_data = notice_data.get(artist_type)
-    artists = []
-    for artist_data in artists_data:
-        last_name = artist_data.get("last_name")
-        first_name = artist_data.get("first_name")
-        birth_year = artist_data.get("birth_year")
-        death_year = artist_data.get("death_year")
-
-        if not model.select().where(
-                (model.last_name == last_name) &
-                (model.first_name == first_name) &
-                (model.birth_year == birth_year) &
-                (model.death_year == death_year)
-        ).exists():
-            artist = model.create(
-                last_name=last_name,
-                first_name=first_name,
-                birth_year=birth_year,
-                death_year=death_year
-            )
-        else:
-            artist = model.select().where(
-                (model.last_name == last_name) &
-                (model.first_name == first_name) &
-                (model.birth_year == birth_year)
-            )
-        artists.append(artist)
-        return artists
-
-
-def handle_book_notice(book_data: dict, publisher: Publisher, authors: list[Author]) -> tuple[bool, bool] | None:
-    """
-    Create a notice with book data if a notice is not existing for this book in the database.
-    If notice is already existing in the database, existing_notice will be True.
-    If notice is new in the database, new_notice wille be True.
-    :return: tuple of booleans(new_notice, existing_notice)
-    """
-    ean = book_data.get("ean")
-    new_notice = existing_notice = False
-    if not BookNotice.select().where(BookNotice.ean == ean).exists():
-        title = book_data.get("title")
-        series_name = book_data.get("series_name")
-        series_volume = book_data.get("series_volume")
-        genre = book_data.get("genre")
-        book_notice: BookNotice = BookNotice.create(
-            ean=ean,
-            title=title,
-            series_name=series_name,
-            series_volume=series_volume,
-            genre=genre,
-            publisher=publisher,
-        )
-        for author in authors:
-            book_notice.artists.add(author)
-        book_notice.get_ref2()
-        book_notice.save()
-        new_notice = True
-        logging.info(StaffCliView.InfoMessages.NOTICE_ADDED.format(
-            notice_type="livre", notice=book_notice))
-    else:
-        existing_notice = True
-        logging.info(StaffCliView.InfoMessages.ALREADY_EXISTING_NOTICE.format(
-            notice_type="livre", notice=BookNotice.get(BookNotice.ean == ean)))
-    return new_notice, existing_notice
-
-
-def handle_film_notice(film_data: dict, directors: list[Director]) -> tuple[bool, bool] | None:
-    """
-    Create a notice with book data if a notice is not existing for this book in the database.
-    If notice is already existing in the database, existing_notice will be True.
-    If notice is new in the database, new_notice wille be True.
-    :return: tuple of booleans(new_notice, existing_notice)
-    """
-    ean = film_data.get("ean")
-    new_notice = existing_notice = False
-    if not FilmNotice.select().where(FilmNotice.ean == ean).exists():
-        title = film_data.get("title")
-        series_name = film_data.get("series_name")
-        series_volume = film_data.get("series_volume")
-        genre = film_data.get("genre")
-        film_notice: FilmNotice = FilmNotice.create(
-            ean=ean,
-            title=title,
-            series_name=series_name,
-            series_volume=series_volume,
-            genre=genre,
-        )
-        for director in directors:
-            film_notice.artists.add(director)
-        film_notice.get_ref2()
-        film_notice.save()
-        new_notice = True
-        logging.info(StaffCliView.InfoMessages.NOTICE_ADDED.format(
-            notice_type="DVD", notice=film_notice))
-    else:
-        existing_notice = True
-        logging.info(StaffCliView.InfoMessages.ALREADY_EXISTING_NOTICE.format(
-            notice_type="DVD", notice=FilmNotice.get(FilmNotice.ean == ean)))
-    return new_notice, existing_notice
-
-
-def handle_music_notice(music_data: dict, musicians: list[Musician]) -> tuple[bool, bool] | None:
-    """
-    Create a notice with CD data if a notice is not existing for this CD in the database.
-    If notice is already existing in the database, existing_notice will be True.
-    If notice is new in the database, new_notice wille be True.
-    :return: tuple of booleans(new_notice, existing_notice)
-    """
-    ean = music_data.get("ean")
-    new_notice = existing_notice = False
-    if not MusicNotice.select().where(MusicNotice.ean == ean).exists():
-        title = music_data.get("title")
-        genre = music_data.get("genre")
-        music_notice: MusicNotice = MusicNotice.create(
-            ean=ean,
-            title=title,
-            genre=genre,
-        )
-        for musician in musicians:
-            music_notice.artists.add(musician)
-        music_notice.get_ref2()
-        music_notice.save()
-        new_notice = True
-        logging.info(StaffCliView.InfoMessages.NOTICE_ADDED.format(
-            notice_type="CD", notice=music_notice))
-    else:
-        existing_notice = True
-        logging.info(StaffCliView.InfoMessages.ALREADY_EXISTING_NOTICE.format(
-            notice_type="CD", notice=MusicNotice.get(MusicNotice.ean == ean)))
-    return new_notice, existing_notice
+def get_users_by_card_number(card_numbers: list[str]) -> dict[str, User]:
+    """Get users from their card numbers, with one query"""
+    return {user.card_number: user for user in User.select().where(User.card_number.in_(list(set(card_numbers))))}
 
 
 def is_existing_card_number(card_number: str) -> bool:
@@ -410,16 +246,13 @@ def is_existing_card_number(card_number: str) -> bool:
 
 def is_existing_copy_barcode(barcode: str) -> bool:
     """
-    Check if document barcode exists in tables BookCopies, FilmCopies or MusicCopies
+    Check if document barcode exists in the copies barcodes registry
     >>> is_existing_copy_barcode("000000000001")
     True
     >>> is_existing_copy_barcode("000009999999")
     False
     """
-    for model in COPIES_MODELS:
-        if model.select().where(model.barcode == barcode).exists():
-            return True
-    return False
+    return CopyBarcode.is_existing_barcode(barcode)
 
 
 def is_existing_ean(ean: str) -> bool:
@@ -430,10 +263,7 @@ def is_existing_ean(ean: str) -> bool:
     >>> is_existing_ean("9780000000000")
     False
     """
-    for model in NOTICES_MODELS:
-        if model.select().where(model.ean == ean).exists():
-            return True
-    return False
+    return EAN_RESOLVER.is_existing_ean(ean)
 
 
 def is_overdue(barcode: str) -> bool:
@@ -461,11 +291,7 @@ def is_reserved_by(barcode: str) -> str | None:
 
 def is_reserved_by_self(barcode: str, card_number: str) -> bool:
     """True if user has a pending or available reservation of the document"""
-    reservations = get_reservations_from_card_number(card_number)
-    for reservation in reservations:
-        if reservation.notice == get_notice_from_barcode(barcode):
-            return True
-    return False
+    return Reservation.is_copy_reserved_by(barcode, card_number)
 
 
 def is_valid_and_existing_card_number(card_number: str) -> bool:
@@ -539,15 +365,27 @@ def is_valid_ean(ean: str) -> bool:
     return ValidExpressions.EAN.match(ean) is not None
 
 
-def is_valid_json_file(file: str) -> bool:
-    """True if file is a valid json file, False otherwise"""
-    try:
-        with open(file, "r", encoding="utf-8") as f:
-            json.load(f)
-            return True
-    except Exception as e:
-        BaseCliView.display_exception_message(file, e)
-        return False
+def get_record_problems(notice_model, record: dict) -> list[str]:
+    """
+    Get the problems of a record with the catalog rules, that don't prevent its import:
+    EAN (see is_valid_ean), artists names (see is_valid_name) and genre (see GENRES_TO_REFS1)
+    """
+    problems = []
+    if record.get("ean") and not is_valid_ean(str(record["ean"])):
+        problems.append(f"EAN invalide ({record["ean"]})")
+    for artist in record.get(ARTISTS_FIELDS[notice_model]) or []:
+        for name in (artist.get("last_name"), artist.get("first_name")):
+            if name and not is_valid_name(str(name)):
+                problems.append(f"nom invalide ({name})")
+    if record.get("genre") and record["genre"] not in GENRES_TO_REFS1:
+        problems.append(f"genre inconnu ({record["genre"]})")
+    return problems
+
+
+def read_barcodes_file(file: str) -> list[str]:
+    """Read copies barcodes from a text file (one per line, as written by a scanner)"""
+    with open(file, "r", encoding="utf-8") as f:
+        return [line.strip().upper() for line in f if line.strip()]
 
 
 def is_valid_name(name: str) -> bool:
@@ -569,31 +407,3 @@ def is_valid_name(name: str) -> bool:
     False
     """
     return ValidExpressions.NAME.match(name) is not None
-
-
-def remove_diacritical_marks(text: str) -> str:
-    """
-    Remove all diacritical marks from a string
-    >>> remove_diacritical_marks("Éàçèï oôö")
-    'Eacei ooo'
-    """
-    text = unicodedata.normalize("NFD", text)
-    return "".join(char for char in text if unicodedata.category(char) != "Mn")
-
-
-def word_is_in_charfields(word: str, instance: BaseNotice) -> bool:
-    """Checks if a word is in the charfields of a model, or in the charfields of a related model"""
-    for field_name, field_type in instance._meta.fields.items():
-        if isinstance(field_type, CharField):
-            field_value = getattr(instance, field_name)
-            if field_value and word.lower() in get_normalized_words(field_value):
-                return True
-        if isinstance(field_type, ForeignKeyField):
-            related_instance = getattr(instance, field_name)
-            if related_instance and word_is_in_charfields(word, related_instance):
-                return True
-    if hasattr(instance, "artists"):
-        for artist in instance.artists:
-            if word_is_in_charfields(word, artist):
-                return True
-    return False
@@ -0,0 +1,375 @@
+"""
+Import of notices from vendors files, in batches (a few queries per chunk of records, whatever its size).
+The files of a folder are read and normalized in parallel, by other processes than the one writing the notices.
+"""
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+from multiprocessing import get_context
+from pathlib import Path
+from queue import Empty
+from typing import Callable, Iterable, Iterator, NamedTuple, NoReturn
+
+from gere_ta_bib.models.contributors import BaseArtist, ContributorResolver, Publisher, get_artist_key
+from gere_ta_bib.models.imports import ImportedFile
+from gere_ta_bib.models.notices import BaseNotice, BookNotice, FilmNotice, MusicNotice, NOTICES_MODELS
+from gere_ta_bib.models.search_index import index_new_notices, set_completions
+from gere_ta_bib.utils.constants import DB, IMPORT_CHUNK_SIZE, IMPORT_MAX_WORKERS, IMPORT_PROGRESS_STEP, \
+    IMPORT_QUEUE_SIZE, IMPORT_QUEUE_TIMEOUT, NOTICES_FILES_SUFFIXES, SQL_BATCH_SIZE
+from gere_ta_bib.utils.exceptions import ValidationError
+from gere_ta_bib.utils.notices_files import read_notices_file
+from gere_ta_bib.views.cli.staff_cli_view import StaffCliView
+
+ARTISTS_FIELDS = {BookNotice: "authors", FilmNotice: "directors", MusicNotice: "musicians"}  # keys in records
+NOTICES_FIELDS = ("ean", "title", "series_name", "series_volume", "genre")  # keys in records (if in the model)
+NOTICES_TYPES_NAMES = {BookNotice: "livre", FilmNotice: "DVD", MusicNotice: "CD"}  # in log messages
+
+
+class DryRunReport(NamedTuple):
+    """Numbers of an import dry run (see check_notices_data)"""
+    nb_read: int
+    nb_new: int  # notices that would be added
+    nb_existing: int
+    nb_errors: int  # records that would be rejected
+    nb_to_check: int  # records that would be imported, but don't follow the catalog rules
+    nb_new_artists: int
+    nb_new_publishers: int
+    duration: float  # seconds
+
+
+class NoticeRecord(NamedTuple):
+    """A record checked and formatted as its notice would be saved (picklable, so it can come from another process)"""
+    fields: dict  # values of the notice fields, ref1 and ref2 included
+    artists: tuple[tuple, ...]  # keys of the artists (see get_artist_key), in the order of the record
+    publisher: str | None
+
+
+def normalize_record(notice_model, record: dict) -> NoticeRecord | NoReturn:
+    """
+    Check and format a record as its notice would be saved: artists names (see BaseArtist.save), ref1 and ref2.
+    Needs no database, so that records can be normalized in other processes than the one writing them.
+    """
+    notice = notice_model(**{name: record.get(name) for name in NOTICES_FIELDS if name in notice_model._meta.fields})
+    if not notice.ean or not notice.title:
+        raise ValidationError(f"Notice sans EAN ou sans titre: {record}")
+    artists = []
+    for artist_data in record.get(ARTISTS_FIELDS[notice_model]) or []:
+        try:
+            artists.append(notice_model.artists.rel_model.from_record(artist_data))
+        except ValidationError as e:
+            raise ValidationError(f"Notice {notice.ean}: {e}")
+    notice.prefetched_artists = artists
+    notice.ref1 = notice.get_ref1()
+    notice.ref2 = notice.get_ref2()
+    return NoticeRecord(fields={name: value for name, value in notice.__data__.items() if value is not None},
+                        artists=tuple(get_artist_key(artist) for artist in artists),
+                        publisher=(record.get("publisher") or None) if "publisher" in notice_model._meta.fields
+                        else None)
+
+
+def normalize_notices_file(notice_model, file: str | Path, start: int, queue) -> None:
+    """
+    Read and normalize the records of a notices file (see normalize_record) from the start-th, in a worker process,
+    and put them in a queue by lists of IMPORT_CHUNK_SIZE, then None when the file is read.
+    The records that can't be read or normalized are replaced by their error, so that they are counted.
+    The queue is bounded, so that the worker doesn't read much more of the file than is written.
+    """
+    records = []
+    try:
+        for record in islice(read_notices_file(file, ARTISTS_FIELDS[notice_model]), start, None):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                records.append(normalize_record(notice_model, record))
+            except Exception as e:  # any error is sent back as a ValidationError, that can always be pickled
+                records.append(e if isinstance(e, ValidationError) else ValidationError(str(e)))
+            if len(records) >= IMPORT_CHUNK_SIZE:
+                queue.put(records)
+                records = []
+    except ValidationError as e:
+        records.append(e)
+    queue.put(records)
+    queue.put(None)
+
+
+def get_queued_records(queue, task: Future) -> Iterator[NoticeRecord | ValidationError]:
+    """
+    Get the records put in a queue by normalize_notices_file, one by one, until the file is read.
+    :raise Exception: the error of the task if it stopped before the end of the file (worker process killed...)
+    """
+    while True:
+        try:
+            records = queue.get(timeout=IMPORT_QUEUE_TIMEOUT)
+        except Empty:
+            if task.done() and task.exception():
+                raise task.exception()
+            continue
+        if records is None:
+            return
+        yield from records
+
+
+class NoticesImporter:
+    """
+    Import notices of one model from records (dicts shaped like the files of EXAMPLES_NOTICES_FOLDER).
+    The EANs, artists (see ContributorResolver) and publishers already in database are loaded once in memory.
+    New notices are buffered, then written by chunks of chunk_size, each in one transaction with a few INSERTs:
+    new contributors, notices, artists links and search index. If a chunk fails, its notices are written
+    one by one, so that only the faulty ones are counted as errors.
+    With dry_run, nothing is written: chunks are only counted, with the contributors they would add.
+    """
+
+    def __init__(self, notice_model, chunk_size: int = IMPORT_CHUNK_SIZE, dry_run: bool = False):
+        self.notice_model = notice_model
+        self.dry_run = dry_run
+        self.artist_model = notice_model.artists.rel_model
+        self.chunk_size = chunk_size
+        self.eans = {ean for ean, in notice_model.select(notice_model.ean).tuples()}
+        self.resolver = ContributorResolver(self.artist_model)
+        self.publishers = ({publisher.name: publisher for publisher in Publisher.select()}
+                           if "publisher" in notice_model._meta.fields else {})
+        self.pending = []  # (notice, artists) of the new notices not written yet
+        self.nb_read = self.nb_new = self.nb_existing = self.nb_errors = 0
+        self.nb_flushes = 0  # chunks written (or tried)
+        self.new_artists, self.new_publishers = set(), set()  # keys and names that a dry run would add
+
+    def add_record(self, record: dict | NoticeRecord | Exception) -> None:
+        """
+        Count a record as existing or as an error, or buffer its notice (written when the buffer is full).
+        The record can be already normalized, or be the error raised by the reader of a file for a record
+        it couldn't read.
+        """
+        try:
+            if isinstance(record, Exception):
+                raise record
+            notice, artists = self.read_record(record if isinstance(record, NoticeRecord)
+                                               else normalize_record(self.notice_model, record))
+        except Exception as e:
+            self.nb_errors += 1
+            logging.error(e)
+            return
+        if notice.ean in self.eans:
+            self.nb_existing += 1
+            logging.info(StaffCliView.InfoMessages.ALREADY_EXISTING_NOTICE.format(
+                notice_type=NOTICES_TYPES_NAMES[self.notice_model], notice=notice))
+            return
+        self.eans.add(notice.ean)
+        self.pending.append((notice, artists))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def count(self, pending: list[tuple[BaseNotice, list[BaseArtist]]]) -> None:
+        """Count new notices as if they were written, with the contributors they would add (dry run)"""
+        for notice, artists in pending:
+            self.new_artists.update(key for key in map(get_artist_key, artists) if key not in self.resolver.artists)
+            if getattr(notice, "publisher", None) and notice.publisher.name not in self.publishers:
+                self.new_publishers.add(notice.publisher.name)
+        self.nb_new += len(pending)
+
+    def flush(self) -> None:
+        """Write the buffered notices (one by one if the chunk fails)"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        self.nb_flushes += 1
+        if self.dry_run:
+            self.count(pending)
+            return
+        try:
+            self.write(pending)
+            return
+        except Exception as e:
+            if len(pending) == 1:
+                self.nb_errors += 1
+                self.eans.discard(pending[0][0].ean)
+                logging.error(e)
+                return
+        for notice_and_artists in pending:
+            self.pending = [notice_and_artists]
+            self.flush()
+
+    def import_file(self, entry: ImportedFile, records: Iterable[dict | NoticeRecord | Exception],
+                    progress: Callable[[int, int, int, int], None] | None = None) -> tuple[int, int, int]:
+        """
+        Import the records of a file not completely imported yet, given from where its last import stopped
+        (from the entry.nb_records-th record), and record in the imports ledger how far it goes after each chunk
+        :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors) for this file
+        """
+        before = self.nb_new, self.nb_existing, self.nb_errors
+        start, nb_read = entry.nb_records, self.nb_read
+        self.import_records(records, progress, lambda nb_records: entry.set_progress(start + nb_records))
+        entry.set_progress(start + self.nb_read - nb_read, is_complete=True)
+        after = self.nb_new, self.nb_existing, self.nb_errors
+        return tuple(nb_after - nb_before for nb_after, nb_before in zip(after, before))
+
+    def import_records(self, records: Iterable[dict | NoticeRecord | Exception],
+                       progress: Callable[[int, int, int, int], None] | None = None,
+                       checkpoint: Callable[[int], None] | None = None) -> tuple[int, int, int]:
+        """
+        Import notices from records, read one by one (for example from a file, see notices_files.py).
+        If the reader raises an error, the records read before it are imported, and the error is counted.
+        :param progress: called every IMPORT_PROGRESS_STEP records with the numbers of read records,
+        new notices (written so far), existing notices and errors (counted since the importer was created)
+        :param checkpoint: called after each written chunk with the number of records (from the first one
+        of records) whose notices are written, or counted as existing or as errors
+        :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors),
+        counted since the importer was created
+        """
+        nb_read, nb_flushes = 0, self.nb_flushes
+        try:
+            for record in records:
+                self.add_record(record)
+                nb_read += 1
+                self.nb_read += 1
+                if progress and self.nb_read % IMPORT_PROGRESS_STEP == 0:
+                    progress(self.nb_read, self.nb_new, self.nb_existing, self.nb_errors)
+                if checkpoint and self.nb_flushes != nb_flushes:
+                    checkpoint(nb_read)
+                    nb_flushes = self.nb_flushes
+        except ValidationError as e:
+            self.nb_errors += 1
+            logging.error(e)
+        self.flush()
+        return self.nb_new, self.nb_existing, self.nb_errors
+
+    def insert_new_publishers(self, notices: list[BaseNotice]) -> dict[str, Publisher]:
+        """Insert the publishers not in database yet (once each), and return them (saved) by name"""
+        publishers = [getattr(notice, "publisher", None) for notice in notices]
+        names = list({publisher.name for publisher in publishers
+                      if publisher and publisher.name not in self.publishers})
+        if not names:
+            return {}
+        for i in range(0, len(names), SQL_BATCH_SIZE):
+            (Publisher
+             .insert_many([(name,) for name in names[i:i + SQL_BATCH_SIZE]], fields=[Publisher.name])
+             .on_conflict_ignore()
+             .execute())
+        return {publisher.name: publisher for publisher in Publisher.select().where(Publisher.name.in_(names))}
+
+    def read_record(self, record: NoticeRecord) -> tuple[BaseNotice, list[BaseArtist]]:
+        """Build a notice (not saved) and its artists from a normalized record, with the known contributors"""
+        notice = self.notice_model(**record.fields)
+        artists = [self.resolver.get(self.artist_model(last_name=last_name, first_name=first_name,
+                                                       birth_year=birth_year, death_year=death_year))
+                   for last_name, first_name, birth_year, death_year in record.artists]
+        if record.publisher:
+            notice.publisher = self.publishers.get(record.publisher) or Publisher(name=record.publisher)
+        notice.prefetched_artists = artists
+        notice._created_at = notice.updated_at = date.today()
+        return notice, artists
+
+    def write(self, pending: list[tuple[BaseNotice, list[BaseArtist]]]) -> None:
+        """Write new notices in one transaction, with their new contributors, artists links and search index"""
+        model = self.notice_model
+        notices = [notice for notice, _ in pending]
+        fields = [field for field in model._meta.sorted_fields if field.name != "id"]
+        with DB.atomic("IMMEDIATE"):
+            new_artists = self.resolver.insert_new_artists([artist for _, artists in pending for artist in artists])
+            new_publishers = self.insert_new_publishers(notices)
+            artists_by_key = self.resolver.artists | new_artists
+            publishers_by_name = self.publishers | new_publishers
+            for notice, artists in pending:
+                if getattr(notice, "publisher", None):
+                    notice.publisher = publishers_by_name[notice.publisher.name]
+                notice.prefetched_artists = list({get_artist_key(artist): artists_by_key[get_artist_key(artist)]
+                                                  for artist in artists}.values())
+            model.insert_many([[notice.__data__.get(field.name) for field in fields] for notice in notices],
+                              fields=fields).execute()
+            ids_by_ean = dict(model
+                              .select(model.ean, model.id)
+                              .where(model.ean.in_([notice.ean for notice in notices]))
+                              .tuples())
+            for notice in notices:
+                notice.id = ids_by_ean[notice.ean]
+            model.link_artists({notice.id: [artist.id for artist in notice.prefetched_artists]
+                                for notice in notices})
+            index_new_notices(notices, {notice.id: notice.prefetched_artists for notice in notices})
+        self.resolver.add_artists(new_artists)
+        self.publishers.update(new_publishers)
+        set_completions(notices)
+        self.nb_new += len(notices)
+        for notice in notices:
+            logging.info(StaffCliView.InfoMessages.NOTICE_ADDED.format(
+                notice_type=NOTICES_TYPES_NAMES[model], notice=notice))
+
+
+def get_notices_files(path: str | Path) -> list[Path]:
+    """Get the notices files of a folder and its subfolders (see NOTICES_FILES_SUFFIXES), or a file alone"""
+    if Path(path).is_file():
+        return [Path(path)]
+    return sorted(file for file in Path(path).rglob("*")
+                  if file.is_file() and file.suffix.lower() in NOTICES_FILES_SUFFIXES)
+
+
+def import_notices_file(notice_model, file: str | Path,
+                        progress: Callable[[int, int, int, int], None] | None = None) -> tuple[int, int, int] | None:
+    """
+    Import a notices file, from where its last import stopped if it was interrupted (see ImportedFile)
+    :param progress: see NoticesImporter.import_records
+    :return: a tuple of integers (nb of new notices, nb of existing notices, nb of errors),
+    None if the file has already been imported (same content)
+    :raise OSError: if the file can't be opened
+    """
+    entry = ImportedFile.get_entry(file, NOTICES_MODELS[notice_model])
+    if entry.is_complete:
+        logging.info(StaffCliView.InfoMessages.FILE_ALREADY_IMPORTED.format(file=file))
+        return None
+    records = islice(read_notices_file(file, ARTISTS_FIELDS[notice_model]), entry.nb_records, None)
+    return NoticesImporter(notice_model).import_file(entry, records, progress)
+
+
+def import_notices_folder(notice_model, folder: str | Path,
+                          progress: Callable[[int, int, int, int], None] | None = None,
+                          max_workers: int | None = IMPORT_MAX_WORKERS) -> dict[Path, tuple[int, int, int] | None]:
+    """
+    Import the notices files of a folder and its subfolders (see NOTICES_FILES_SUFFIXES).
+    Files already imported (same content) are skipped, interrupted ones are resumed (see ImportedFile).
+    Other files are read and normalized in parallel by a pool of processes (one file per task), while this process
+    is the only one writing to the database (SQLite allows one writer at a time), with one NoticesImporter.
+    Each file comes by chunks through its own bounded queue, and only a few files are read at a time,
+    so that memory depends neither on the size nor on the number of files.
+    :param progress: see NoticesImporter.import_records (numbers counted over all the files)
+    :param max_workers: number of processes (one per core by default)
+    :return: a dict with files as keys and tuples (nb of new notices, nb of existing notices, nb of errors)
+    as values (None for the files already imported)
+    """
+    counts_by_file, entries = {}, []
+    for file in get_notices_files(folder):
+        try:
+            entry = ImportedFile.get_entry(file, NOTICES_MODELS[notice_model])
+        except OSError as e:  # the file can't be opened to get its hash
+            logging.error(f"{file}: fichier illisible ({e}).")
+            counts_by_file[file] = (0, 0, 1)
+            continue
+        if entry.is_complete:
+            logging.info(StaffCliView.InfoMessages.FILE_ALREADY_IMPORTED.format(file=file))
+            counts_by_file[file] = None
+        else:
+            entries.append((file, entry))
+    if not entries:
+        return counts_by_file
+    importer = NoticesImporter(notice_model)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(entries))
+    with ProcessPoolExecutor(max_workers, mp_context=get_context("spawn")) as executor, \
+            get_context("spawn").Manager() as manager:
+        tasks = deque()
+        for i, (file, entry) in enumerate(entries):
+            queue = manager.Queue(IMPORT_QUEUE_SIZE)
+            tasks.append((file, entry, queue,
+                          executor.submit(normalize_notices_file, notice_model, file, entry.nb_records, queue)))
+            while tasks and (len(tasks) > 2 * max_workers or i == len(entries) - 1):
+                file, entry, queue, task = tasks.popleft()
+                try:
+                    counts_by_file[file] = importer.import_file(entry, get_queued_records(queue, task), progress)
+                except Exception as e:  # the file couldn't be read to the end (worker process killed, for example)
+                    importer.nb_errors += 1
+                    logging.error(f"{file}: {e}")
+                    counts_by_file[file] = (0, 0, 1)
+    return counts_by_file
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,97 @@
+"""Maintenance jobs (daily statuses updates), run in the background once a day"""
+import logging
+from datetime import date
+from threading import Thread
+from time import perf_counter
+from typing import Callable
+
+from gere_ta_bib.models.maintenance import MaintenanceRun
+from gere_ta_bib.models.reservation import Reservation
+from gere_ta_bib.models.transaction import Transaction
+from gere_ta_bib.models.users import User
+from gere_ta_bib.utils.constants import DB, LOG_FORMAT, LOGS_FOLDER_PATH, MAINTENANCE_LOG_FILE, MAINTENANCE_LOGGER, \
+    MaintenanceJobs
+from gere_ta_bib.utils.database import is_in_memory_database
+from gere_ta_bib.views.cli.base_cli_view import BaseCliView
+
+LOGGER = logging.getLogger(MAINTENANCE_LOGGER)
+
+
+class MaintenanceScheduler:
+    """
+    Run maintenance jobs once a day, in a worker thread (with its own database connection).
+    Each job gets the date of its last run, so that it can only update what changed since then.
+    A job is run in an immediate transaction, in which its last run date is checked then updated:
+    if several programs are launched, a job is run by the first one only.
+    """
+
+    def __init__(self, jobs: dict[str, Callable[[date | None], int]]):
+        self.jobs = jobs
+        self.thread = None
+
+    def run_job(self, name: str, job: Callable[[date | None], int]) -> int | None:
+        """Run a job if it hasn't been run today. Return the number of updated rows, None if not run."""
+        today = date.today()
+        with DB.atomic("IMMEDIATE"):
+            last_run = MaintenanceRun.get_last_run(name)
+            if last_run == today:
+                return None
+            since = last_run if last_run and last_run < today else None  # everything if never run (or clock changed)
+            nb_of_updated = job(since)
+            MaintenanceRun.set_last_run(name, today)
+        return nb_of_updated
+
+    def run_jobs(self) -> dict[str, int | None]:
+        """Run all jobs (if not run today), logging their outcome. Return the number of updated rows by job."""
+        results = {}
+        for name, job in self.jobs.items():
+            start = perf_counter()
+            try:
+                results[name] = self.run_job(name, job)
+            except Exception as e:
+                results[name] = None
+                LOGGER.error(BaseCliView.ErrorMessages.MAINTENANCE_JOB_FAILED.format(job=name, error=e))
+                continue
+            if results[name] is None:
+                LOGGER.info(BaseCliView.InfoMessages.MAINTENANCE_JOB_ALREADY_DONE.format(job=name))
+            else:
+                LOGGER.info(BaseCliView.InfoMessages.MAINTENANCE_JOB_DONE.format(
+                    job=name, nb=results[name], duration=perf_counter() - start))
+        return results
+
+    def start(self) -> None:
+        """
+        Run all jobs in a worker thread (the program waits for it before exiting).
+        A database in memory has only one connection, shared by all threads: the jobs are then run right away.
+        """
+        if is_in_memory_database():
+            self.run_jobs()
+            return
+        self.thread = Thread(target=self.run_jobs, name="maintenance")
+        self.thread.start()
+
+
+def configure_maintenance_log() -> None:
+    """
+    Log the migrations and the maintenance jobs in MAINTENANCE_LOG_FILE (in the logs folder), and only there:
+    not in the console, where the jobs would write over the menus.
+    """
+    if LOGGER.handlers:
+        return
+    LOGS_FOLDER_PATH.mkdir(exist_ok=True)
+    handler = logging.FileHandler(LOGS_FOLDER_PATH / MAINTENANCE_LOG_FILE, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(f"%(asctime)s {LOG_FORMAT}"))
+    LOGGER.addHandler(handler)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+
+
+MAINTENANCE_SCHEDULER = MaintenanceScheduler({
+    MaintenanceJobs.OVERDUES: Transaction.refresh_overdues,
+    MaintenanceJobs.RESERVATIONS: Reservation.refresh_statuses,
+    MaintenanceJobs.MEMBERSHIPS: User.refresh_active_statuses,
+})
+
+
+if __name__ == '__main__':
+    pass
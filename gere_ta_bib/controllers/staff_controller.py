@@ -7,14 +7,17 @@ from gere_ta_bib.controllers.base_controller import BaseController
 from gere_ta_bib.controllers.helpers import check_numeric_choice, exit_func, is_valid_name, check_user_account, \
     get_user_from_card_number, is_valid_ean, is_existing_ean, get_notice_from_ean, get_copy_model_from_notice, \
     is_valid_and_existing_copy_barcode, get_copy_from_barcode, extract_books_data, extract_films_data, \
-    extract_musics_data, is_valid_json_file
+    extract_musics_data, read_barcodes_file, get_users_by_card_number, check_notices_data
+from gere_ta_bib.controllers.importer import import_notices_folder
 from gere_ta_bib.models.copies import BaseCopy, COPIES_MODELS
 from gere_ta_bib.models.notices import BaseNotice, NOTICES_MODELS, BookNotice, FilmNotice
 from gere_ta_bib.models.reservation import Reservation
-from gere_ta_bib.models.transaction import Transaction
+from gere_ta_bib.models.transaction import Transaction, BorrowedCopy
 from gere_ta_bib.models.users import User
 from gere_ta_bib.utils.constants import STAFF_ACTIONS, YES_NO, StaffActionsNames, RENEWAL_NB_OF_DAYS_ADDED_TO_TODAY, \
-    STAFF_OTHER_ACTIONS, StaffOtherActionsNames, QUIT_LETTER, DOC_TYPES_NAMES, LOGS_FOLDER_PATH, LOG_FORMAT
+    STAFF_OTHER_ACTIONS, StaffOtherActionsNames, QUIT_LETTER, DOC_TYPES_NAMES, LOGS_FOLDER_PATH, LOG_FORMAT, DB, \
+    NOTICES_FILES_SUFFIXES
+from gere_ta_bib.utils.exceptions import AlreadyBorrowedByOtherError
 from gere_ta_bib.views.cli.staff_cli_view import StaffCliView
 
 
@@ -39,6 +42,8 @@ class StaffController(BaseController):
             StaffOtherActionsNames.DELETE_COPY.value: self.delete_copy,
             StaffOtherActionsNames.ADD_NOTICES.value: self.add_notices,
             StaffOtherActionsNames.STATS.value: self.show_statistics,
+            StaffOtherActionsNames.BORROW_MANY.value: self.borrow_many,
+            StaffOtherActionsNames.RETURN_BOX.value: self.return_box,
         }
 
     def add_new_user(self) -> None:
@@ -69,7 +74,7 @@ class StaffController(BaseController):
             self.view.new_user_created(new_user)
 
     def add_notices(self) -> None:
-        """Add notices from json files"""
+        """Add notices from a notices file (json, csv, marc...), or from all the notices files of a folder"""
 
         # region Notice type choice
         self.view.notices_to_add_info()
@@ -86,7 +91,7 @@ class StaffController(BaseController):
         notice_model = notice_model_by_name[doc_type]
         # endregion
 
-        # region Path checking of the json file or folder
+        # region Path checking of the notices file or folder
         while True:
             notices_path = self.view.prompt_notices_path()
             if notices_path.upper() == QUIT_LETTER:
@@ -94,25 +99,19 @@ class StaffController(BaseController):
             if not Path(notices_path).exists():
                 self.view.not_existing_path(notices_path)
                 continue
-            if Path(notices_path).is_dir() and not list(Path(notices_path).rglob("*.json")):
+            if Path(notices_path).is_dir() and not any(file.suffix.lower() in NOTICES_FILES_SUFFIXES
+                                                       for file in Path(notices_path).rglob("*")):
                 self.view.not_json_folder(str(notices_path))
                 continue
-            if Path(notices_path).is_file() and not Path(notices_path).suffix == ".json":
+            if Path(notices_path).is_file() and Path(notices_path).suffix.lower() not in NOTICES_FILES_SUFFIXES:
                 self.view.not_json_file(str(notices_path))
                 continue
-            if Path(notices_path).is_file() and not is_valid_json_file(notices_path):
-                continue
-            if Path(notices_path).is_dir():
-                nb_errors = 0
-                for file in Path(notices_path).rglob("*.json"):
-                    if not is_valid_json_file(str(file)):
-                        nb_errors += 1
-                if nb_errors > 0:
-                    continue
-            break
+            break  # files are checked while they are imported, record by record
+        dry_run = self.view.prompt_notices_dry_run().upper() == YES_NO["YES"]
         # endregion
 
         # region Logger
+        LOGS_FOLDER_PATH.mkdir(exist_ok=True)
         logging.basicConfig(encoding="utf-8",
                             filename=str(LOGS_FOLDER_PATH / f"{datetime.now().strftime('%y%m%d_%Hh%Mm%Ss')}.log"),
                             level=logging.INFO,
@@ -120,16 +119,57 @@ class StaffController(BaseController):
         # endregion
 
         # region Notices handling
-        if notice_model == BookNotice:
-            nb_new, nb_existing, nb_errors = extract_books_data(notices_path)
-        elif notice_model == FilmNotice:
-            nb_new, nb_existing, nb_errors = extract_films_data(notices_path)
-        else:  # notice_model == MusicNotice:
-            nb_new, nb_existing, nb_errors = extract_musics_data(notices_path)
+        try:
+            if dry_run:
+                report = check_notices_data(notice_model, notices_path, self.view.import_progress)
+                self.view.notices_dry_run_end(*report)
+                return
+            if Path(notices_path).is_dir():
+                counts_by_file = import_notices_folder(notice_model, notices_path, self.view.import_progress)
+                for file, counts in counts_by_file.items():
+                    if counts is None:
+                        self.view.file_already_imported(str(file.relative_to(notices_path)))
+                    else:
+                        self.view.file_imported(str(file.relative_to(notices_path)), *counts)
+                nb_new, nb_existing, nb_errors = (sum(counts[i] for counts in counts_by_file.values() if counts)
+                                                  for i in range(3))
+            else:
+                if notice_model == BookNotice:
+                    counts = extract_books_data(notices_path, self.view.import_progress)
+                elif notice_model == FilmNotice:
+                    counts = extract_films_data(notices_path, self.view.import_progress)
+                else:  # notice_model == MusicNotice:
+                    counts = extract_musics_data(notices_path, self.view.import_progress)
+                if counts is None:
+                    self.view.file_already_imported(notices_path)
+                    return
+                nb_new, nb_existing, nb_errors = counts
+        except OSError as e:  # a file that can't even be opened (unreadable records are counted as errors)
+            self.view.display_exception_message(notices_path, e)
+            return
         # endregion
 
         self.view.notices_added_end(nb_new, nb_existing, nb_errors)
 
+    @check_user_account
+    def borrow_many(self, **kwargs) -> None:
+        """Borrow a stack of documents at once (scanned one after the other, then recorded together)"""
+        card_number = kwargs.get("card_number")
+        barcodes = self.view.prompt_copies_barcodes()
+        if not barcodes:
+            return
+        with DB.atomic("IMMEDIATE"):
+            outcomes = Transaction.borrow_many(card_number, barcodes)
+            # As in borrow: a copy borrowed by someone else is in hand, so its previous loan is closed
+            borrowed_by_other = [barcode for barcode, error in outcomes.items()
+                                 if isinstance(error, AlreadyBorrowedByOtherError)]
+            if borrowed_by_other:
+                Transaction.close_current_loans(borrowed_by_other)
+                outcomes.update(Transaction.borrow_many(card_number, borrowed_by_other))
+            Reservation.pick_up(card_number, [barcode for barcode, error in outcomes.items() if error is None])
+        self.view.borrow_many_report(outcomes, Transaction.get_borrowed_copies(card_number))
+        self.view.prompt_press_enter()
+
     def choose_other_action(self) -> int | None:
         """Display a new menu with other librarian actions, and return choice"""
         self.view.display_other_actions()
@@ -199,7 +239,7 @@ class StaffController(BaseController):
             )
             self.view.borrow_confirmed(copy)
 
-    def handle_max_nb_of_renewals(self, card_number: str, copy: BaseCopy) -> None:
+    def handle_max_nb_of_renewals(self, card_number: str, copy: BorrowedCopy) -> None:
         """Librarian has to decide to accept renewal or not"""
         decision = self.view.prompt_max_nb_of_renewals()
         if decision.upper() == YES_NO["YES"]:
@@ -232,6 +272,21 @@ class StaffController(BaseController):
         user.save()
         self.view.user_account_updated(user)
 
+    def return_box(self) -> None:
+        """Return a box of documents at once (barcodes scanned, or read from a file), then display the hold shelf"""
+        barcodes = [barcode for line in self.view.prompt_return_box_barcodes()
+                    for barcode in (read_barcodes_file(line) if Path(line).is_file() else [line])]
+        if not barcodes:
+            return
+        with DB.atomic("IMMEDIATE"):
+            outcomes = Transaction.return_many(barcodes)
+            holds = Reservation.assign_returned_copies([barcode for barcode, error in outcomes.items()
+                                                        if error is None])
+        Reservation.prefetch_notices([reservation for _, reservation in holds])
+        users_by_card_number = get_users_by_card_number([reservation.card_number for _, reservation in holds])
+        self.view.return_box_report(outcomes, holds, users_by_card_number)
+        self.view.prompt_press_enter()
+
     def run_secondary_menu(self):
         """Run action from the staff secondary menu"""
         while True:
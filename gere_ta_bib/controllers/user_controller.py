@@ -2,6 +2,7 @@
 
 from gere_ta_bib.controllers.base_controller import BaseController
 from gere_ta_bib.models.copies import BaseCopy
+from gere_ta_bib.models.transaction import BorrowedCopy
 from gere_ta_bib.utils.constants import USER_ACTIONS, UserActionNames
 from gere_ta_bib.views.cli.user_cli_view import UserCliView
 
@@ -26,7 +27,7 @@ class UserController(BaseController):
         """Display a message saying that maximal number of loans was reached"""
         self.view.max_number_of_loans()
 
-    def handle_max_nb_of_renewals(self, card_number: str, copy: BaseCopy) -> None:
+    def handle_max_nb_of_renewals(self, card_number: str, copy: BorrowedCopy) -> None:
         """Display a message saying that maximal number of reservations was reached"""
         self.view.max_number_of_renewals()
 
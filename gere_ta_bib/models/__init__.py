@@ -1 +1,8 @@
-"""Models package"""
+"""
+Models package.
+The models are bound to the default database (see configure_database) until another one is chosen,
+for example by the command line options.
+"""
+from gere_ta_bib.utils.database import configure_database
+
+configure_database()
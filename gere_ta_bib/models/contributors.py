@@ -1,14 +1,41 @@
 """Models for artists"""
 
 from datetime import datetime
+from typing import NoReturn
 
-from peewee import Model, CharField, IntegerField
+from peewee import Model, CharField, IntegerField, fn
 
-from gere_ta_bib.utils.constants import DB
+from gere_ta_bib.models.search_index import get_contributor_notices, index_contributor, index_notices, \
+    remove_completions, set_completions
+from gere_ta_bib.utils.constants import DB, SQL_BATCH_SIZE
 from gere_ta_bib.utils.exceptions import ValidationError
 
 
-class BaseArtist(Model):
+class BaseContributor(Model):
+    """Abstract model for all contributors: keeps the search index of their notices up to date"""
+
+    class Meta:
+        database = DB
+        abstract = True
+
+    def delete_instance(self, *args, **kwargs):
+        notices = get_contributor_notices(self)
+        result = super().delete_instance(*args, **kwargs)
+        index_notices(notices)
+        remove_completions(self)
+        return result
+
+    def get_completion_labels(self) -> list[str]:
+        """Labels proposed to complete the search prompt"""
+        return []
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        index_contributor(self)
+        return result
+
+
+class BaseArtist(BaseContributor):
     """Abstract models for all artists: authors, illustrators, filmmakers etc"""
     last_name = CharField(max_length=50)
     first_name = CharField(max_length=50, null=True)
@@ -20,8 +47,25 @@ class BaseArtist(Model):
         database = DB
         abstract = True
 
-    def save(self, *args, **kwargs):
-        # Dates checking
+    @classmethod
+    def from_record(cls, data: dict) -> "BaseArtist | NoReturn":
+        """Build an artist (not saved) from the data of a notices file, checked and formatted as it would be saved"""
+        artist = cls(last_name=data.get("last_name"), first_name=data.get("first_name"),
+                     birth_year=data.get("birth_year"), death_year=data.get("death_year"))
+        if not artist.last_name:
+            raise ValidationError(f"Artiste sans nom: {data}")
+        artist.check_years()
+        artist.format_names()
+        return artist
+
+    def get_completion_labels(self) -> list[str]:
+        """Complete name of the artist, in both orders (first name first, last name first)"""
+        if not self.first_name:
+            return [str(self.last_name)]
+        return [f"{self.first_name} {self.last_name}", f"{self.last_name} {self.first_name}"]
+
+    def check_years(self) -> None:
+        """Raise a ValidationError if birth or death years are impossible"""
         current_year = datetime.now().year
         if self.death_year:
             if self.death_year > current_year:
@@ -33,10 +77,16 @@ class BaseArtist(Model):
         if self.birth_year and self.birth_year > current_year:
             raise ValidationError(f"La date de naissance de {self.first_name} {self.last_name} "
                                   f"est supérieure à {current_year}...")
-        # Name formatting
+
+    def format_names(self) -> None:
+        """Last name in uppercase, first name capitalized"""
         self.last_name = str(self.last_name).upper()
         if self.first_name:
             self.first_name = str(self.first_name).title()
+
+    def save(self, *args, **kwargs):
+        self.check_years()
+        self.format_names()
         return super().save(*args, **kwargs)
 
 
@@ -73,7 +123,7 @@ class Musician(BaseArtist):
         return f"{str(self.first_name)} {str(self.last_name)}"
 
 
-class Publisher(Model):
+class Publisher(BaseContributor):
     """Model for books publishers"""
     name = CharField(max_length=255, unique=True)
 
@@ -87,3 +137,49 @@ class Publisher(Model):
 
 
 CONTRIBUTORS_MODELS = [Author, Director, Musician, Publisher]
+
+
+def get_artist_key(artist: BaseArtist) -> tuple:
+    """Key identifying an artist (names formatted as saved)"""
+    return artist.last_name, artist.first_name, artist.birth_year, artist.death_year
+
+
+class ContributorResolver:
+    """
+    Artists of one model (Author, Director or Musician) by key (see get_artist_key), loaded once in memory,
+    to find the artists of many notices without any query, and create the missing ones in batches
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.artists = {get_artist_key(artist): artist for artist in model.select()}
+
+    def get(self, artist: BaseArtist) -> BaseArtist:
+        """Get the saved artist with the same key as an artist (formatted as saved), or this artist if it is new"""
+        return self.artists.get(get_artist_key(artist), artist)
+
+    def insert_new_artists(self, artists: list[BaseArtist]) -> dict[tuple, BaseArtist]:
+        """
+        Insert the artists not in database yet (once each), with one query per SQL_BATCH_SIZE artists,
+        and return them (saved) by key. To call in a transaction: they are added to the resolver by add_artists,
+        once it is committed.
+        """
+        new_artists = {}
+        for artist in artists:
+            key = get_artist_key(artist)
+            if key not in self.artists:
+                new_artists[key] = artist
+        if not new_artists:
+            return {}
+        model = self.model
+        fields = [model.last_name, model.first_name, model.birth_year, model.death_year]
+        highest_id = model.select(fn.MAX(model.id)).scalar() or 0
+        rows = list(new_artists)
+        for i in range(0, len(rows), SQL_BATCH_SIZE):
+            model.insert_many(rows[i:i + SQL_BATCH_SIZE], fields=fields).execute()
+        return {get_artist_key(artist): artist for artist in model.select().where(model.id > highest_id)}
+
+    def add_artists(self, artists: dict[tuple, BaseArtist]) -> None:
+        """Add saved artists (by key) to the resolver, and to the completions of the search prompt"""
+        self.artists.update(artists)
+        set_completions(list(artists.values()))
@@ -1,11 +1,14 @@
 """Models for copies (of books, films, etc.)"""
 from datetime import date
+from typing import NoReturn
 
-from peewee import CharField, ForeignKeyField, Model, DateField
+from peewee import CharField, ForeignKeyField, Model, DateField, IntegerField, SQL, fn
 
 # from constants import NOTICE_TYPES
 from gere_ta_bib.models.notices import BookNotice, FilmNotice, MusicNotice
-from gere_ta_bib.utils.constants import DB
+from gere_ta_bib.models.sequences import Sequence
+from gere_ta_bib.utils.constants import DB, DOC_TYPES, COPY_BARCODE_SEQUENCE, ValidExpressions
+from gere_ta_bib.utils.exceptions import ValidationError
 
 
 class BaseCopy(Model):
@@ -22,19 +25,49 @@ class BaseCopy(Model):
     @staticmethod
     def generate_unique_barcode() -> str:
         """Generate a valid and unique barcode for a copy"""
-        barcodes = []
-        for model in COPIES_MODELS:
-            model_barcodes = [copy.barcode for copy in model.select()]
-            barcodes.extend(model_barcodes)
-        highest = max([int(barcode) for barcode in barcodes]) if barcodes else 0
-        return f"{(highest + 1):012d}"
+        return BaseCopy.reserve_barcodes(1)[0]
+
+    @staticmethod
+    def get_highest_barcode() -> int:
+        """
+        Get the highest barcode of all existing copies, as an integer (0 if there is no copy).
+        Barcodes have a fixed width, so the highest one is found on the index.
+        """
+        return int(CopyBarcode.select(fn.MAX(CopyBarcode.barcode)).scalar() or 0)
+
+    @staticmethod
+    def reserve_barcodes(nb: int) -> list[str] | NoReturn:
+        """Reserve a block of nb valid and unique barcodes (for example before cataloguing a delivery)"""
+        first = Sequence.allocate(COPY_BARCODE_SEQUENCE, BaseCopy.get_highest_barcode, nb)
+        barcodes = [f"{number:012d}" for number in range(first, first + nb)]
+        if barcodes and not ValidExpressions.COPY_BARCODE.match(barcodes[-1]):
+            raise ValidationError(f"Plus de codes-barres exemplaires disponibles après {barcodes[0]}.")
+        return barcodes
+
+    def delete_instance(self, *args, **kwargs):
+        with DB.atomic():
+            CopyBarcode.delete().where(CopyBarcode.barcode == self.barcode).execute()
+            return super().delete_instance(*args, **kwargs)
 
     def save(self, *args, **kwargs) -> None:
-        if not self._created_at:
-            self._created_at = date.today()
+        """
+        To call when an instance is created or changed. A new copy is added to the barcodes registry.
+        Its barcode is allocated before the transaction of the copy, so that the allocation has its own
+        immediate transaction.
+        """
+        is_new = not self._created_at
+        if is_new and not self.barcode:
             self.barcode = self.generate_unique_barcode()
-        self.updated_at = date.today()
-        return super().save(*args, **kwargs)
+        with DB.atomic("IMMEDIATE"):
+            if is_new:
+                self._created_at = date.today()
+            self.updated_at = date.today()
+            result = super().save(*args, **kwargs)
+            if is_new:
+                CopyBarcode.create(barcode=self.barcode,
+                                   doc_type=COPIES_MODELS_DOC_TYPES[type(self)],
+                                   copy_id=self.id)
+            return result
 
 
 class BookCopy(BaseCopy):
@@ -73,4 +106,60 @@ class MusicCopy(BaseCopy):
         return f"{str(self.parent_notice)} (n°{str(self.barcode)})"
 
 
+class CopyBarcode(Model):
+    """Registry of the barcodes of all copies, to find a copy (type and id) with one indexed lookup"""
+    barcode = CharField(max_length=12, unique=True)
+    doc_type = CharField(max_length=3)
+    copy_id = IntegerField()
+
+    class Meta:
+        database = DB
+        table_name = "Registre - CODES-BARRES"
+
+    @classmethod
+    def create_registry(cls) -> None:
+        """Create and fill the registry from the copies tables, if it doesn't exist yet in the database"""
+        if cls.table_exists():
+            return
+        with DB.atomic():
+            cls.create_table()
+            for model, doc_type in COPIES_MODELS_DOC_TYPES.items():
+                cls.insert_from(model.select(model.barcode, SQL("?", [doc_type]), model.id),
+                                fields=[cls.barcode, cls.doc_type, cls.copy_id]).execute()
+
+    @classmethod
+    def get_copy(cls, barcode: str) -> BaseCopy | None:
+        """Get a copy from its barcode (None if barcode is unknown)"""
+        entry = cls.get_or_none(cls.barcode == barcode)
+        if entry:
+            return COPIES_MODELS_BY_DOC_TYPE[entry.doc_type].get_by_id(entry.copy_id)
+
+    @classmethod
+    def is_existing_barcode(cls, barcode: str) -> bool:
+        """True if a copy has this barcode, False otherwise"""
+        return cls.select().where(cls.barcode == barcode).exists()
+
+
 COPIES_MODELS = [BookCopy, FilmCopy, MusicCopy]
+COPIES_MODELS_DOC_TYPES = {
+    BookCopy: DOC_TYPES.get("book"),
+    FilmCopy: DOC_TYPES.get("film"),
+    MusicCopy: DOC_TYPES.get("music"),
+}
+COPIES_MODELS_BY_DOC_TYPE = {doc_type: model for model, doc_type in COPIES_MODELS_DOC_TYPES.items()}
+
+
+def select_notices_eans(barcodes: list[str], with_barcodes: bool = False):
+    """
+    Subquery selecting the EANs of the notices of copies (UNION over the copies tables),
+    preceded by the barcodes of the copies if with_barcodes is True
+    """
+    queries = [copy_model
+               .select(*([copy_model.barcode] if with_barcodes else []), copy_model.parent_notice.rel_model.ean)
+               .join(copy_model.parent_notice.rel_model)
+               .where(copy_model.barcode.in_(barcodes))
+               for copy_model in COPIES_MODELS]
+    notices_eans = queries[0]
+    for query in queries[1:]:
+        notices_eans = notices_eans.union_all(query)
+    return notices_eans
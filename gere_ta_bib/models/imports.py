@@ -0,0 +1,51 @@
+"""Model for the imports ledger: notices files already imported, completely or partly"""
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+from peewee import Model, BooleanField, CharField, DateTimeField, IntegerField
+
+from gere_ta_bib.utils.constants import DB
+
+
+class ImportedFile(Model):
+    """
+    A notices file imported for a type of notices, identified by its content (whatever its name or folder),
+    with the number of its records already imported: up to its last written chunk if its import was interrupted
+    """
+    content_hash = CharField(max_length=64)  # SHA-256 of the file
+    doc_type = CharField(max_length=3)
+    path = CharField(max_length=255)  # where the file was last imported from
+    nb_records = IntegerField(default=0)  # records written, already existing or erroneous, from the start of the file
+    is_complete = BooleanField(default=False)
+    updated_at = DateTimeField()
+
+    class Meta:
+        database = DB
+        table_name = "Imports - FICHIERS"
+        indexes = ((("content_hash", "doc_type"), True),)
+
+    @staticmethod
+    def get_file_hash(file: str | Path) -> str:
+        """Get the SHA-256 of the content of a file (read by blocks)"""
+        with open(file, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    @classmethod
+    def get_entry(cls, file: str | Path, doc_type: str) -> "ImportedFile":
+        """Get the entry of a file in the ledger, created if its content has never been imported for this doc_type"""
+        content_hash = cls.get_file_hash(file)
+        (cls
+         .insert(content_hash=content_hash, doc_type=doc_type, path=str(file), updated_at=datetime.now())
+         .on_conflict_ignore()
+         .execute())
+        return cls.get((cls.content_hash == content_hash) & (cls.doc_type == doc_type))
+
+    def set_progress(self, nb_records: int, is_complete: bool = False) -> None:
+        """Record how many records of the file are imported (all of them if is_complete is True)"""
+        self.nb_records, self.is_complete, self.updated_at = nb_records, is_complete, datetime.now()
+        self.save(only=[ImportedFile.nb_records, ImportedFile.is_complete, ImportedFile.updated_at])
+
+
+if __name__ == '__main__':
+    pass
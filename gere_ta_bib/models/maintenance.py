@@ -0,0 +1,26 @@
+"""Model for maintenance jobs runs (for example the daily routine)"""
+from datetime import date
+
+from peewee import Model, CharField, DateField
+
+from gere_ta_bib.utils.constants import DB
+
+
+class MaintenanceRun(Model):
+    """The last date a maintenance job has been run"""
+    job = CharField(max_length=50, unique=True)
+    last_run = DateField()
+
+    class Meta:
+        database = DB
+        table_name = "Maintenance"
+
+    @classmethod
+    def get_last_run(cls, job: str) -> date | None:
+        """Get the last date a job has been run, None if it has never been run"""
+        return cls.select(cls.last_run).where(cls.job == job).scalar()
+
+    @classmethod
+    def set_last_run(cls, job: str, day: date) -> None:
+        """Record the last date a job has been run"""
+        cls.replace(job=job, last_run=day).execute()
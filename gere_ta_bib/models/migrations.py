@@ -0,0 +1,94 @@
+"""
+Versioned migrations of the database schema.
+The schema version is stored in the database itself (PRAGMA user_version): at startup,
+the migrations not applied yet are applied in order, each one in its own transaction.
+To change the schema, add a function at the end of MIGRATIONS (never modify or reorder existing ones).
+"""
+import logging
+
+from peewee import ModelIndex
+
+from gere_ta_bib.models.copies import CopyBarcode
+from gere_ta_bib.models.imports import ImportedFile
+from gere_ta_bib.models.maintenance import MaintenanceRun
+from gere_ta_bib.models.notices import NOTICES_MODELS
+from gere_ta_bib.models.reservation import Reservation
+from gere_ta_bib.models.search_index import create_search_index
+from gere_ta_bib.models.sequences import Sequence
+from gere_ta_bib.models.transaction import Transaction
+from gere_ta_bib.models.users import User
+from gere_ta_bib.utils.constants import DB, MAINTENANCE_LOGGER
+
+
+def create_index(index: ModelIndex) -> None:
+    """Create an index if not existing yet"""
+    DB.execute(index.safe(True))
+
+
+def get_schema_version() -> int:
+    """Get the version of the database schema (0 for a database never migrated)"""
+    return DB.pragma("user_version")
+
+
+def migrate() -> int:
+    """Apply the migrations not applied yet, in order. Return the number of applied migrations."""
+    version = get_schema_version()
+    for new_version, migration in enumerate(MIGRATIONS[version:], version + 1):
+        with DB.atomic():
+            migration()
+            DB.pragma("user_version", new_version)
+        logging.getLogger(MAINTENANCE_LOGGER).info(f"Migration {new_version} appliquée: {migration.__doc__}")
+    return max(len(MIGRATIONS) - version, 0)
+
+
+# region Migrations
+def create_search_indexes() -> None:
+    """Create the catalog search indexes"""
+    create_search_index(NOTICES_MODELS)
+
+
+def create_registries() -> None:
+    """Create the copies barcodes registry and the sequences"""
+    CopyBarcode.create_registry()
+    Sequence.create_table(safe=True)
+
+
+def create_circulation_indexes() -> None:
+    """Create the indexes used by loans and reservations"""
+    open_loans = Transaction.return_date.is_null()
+    create_index(Transaction.index(Transaction.barcode, name="transaction_open_barcode").where(open_loans))
+    create_index(Transaction.index(Transaction.card_number, name="transaction_open_card_number").where(open_loans))
+    create_index(Transaction.index(Transaction.card_number, Transaction.barcode, Transaction.return_date,
+                                   name="transaction_card_number_barcode_return_date"))
+    create_index(Reservation.index(Reservation.ean, Reservation.status, name="reservation_ean_status"))
+    create_index(Reservation.index(Reservation.card_number, Reservation.status,
+                                   name="reservation_card_number_status"))
+
+
+def create_routine_indexes() -> None:
+    """Create the maintenance runs table and the dates indexes used by the daily routine"""
+    MaintenanceRun.create_table(safe=True)
+    create_index(Transaction.index(Transaction.due_date, name="transaction_open_due_date")
+                 .where(Transaction.return_date.is_null()))
+    create_index(Reservation.index(Reservation.expiration_date, name="reservation_expiration_date"))
+    create_index(Reservation.index(Reservation.availability_date, name="reservation_availability_date"))
+    create_index(User.index(User.updated_at, name="user_updated_at"))
+
+
+def create_imports_ledger() -> None:
+    """Create the imports ledger (notices files already imported)"""
+    ImportedFile.create_table(safe=True)
+# endregion
+
+
+MIGRATIONS = [
+    create_search_indexes,
+    create_registries,
+    create_circulation_indexes,
+    create_routine_indexes,
+    create_imports_ledger,
+]
+
+
+if __name__ == '__main__':
+    pass
@@ -1,11 +1,16 @@
 """Models for bibliographic notices"""
 from abc import abstractmethod
+from collections import OrderedDict
 from datetime import date
+from typing import NoReturn
 
-from peewee import Model, CharField, IntegerField, ManyToManyField, ForeignKeyField, DeferredThroughModel, DateField
+from peewee import Model, CharField, IntegerField, ManyToManyField, ForeignKeyField, DeferredThroughModel, DateField, \
+    SQL
 
 from gere_ta_bib.models.contributors import Author, Publisher, Musician, Director
-from gere_ta_bib.utils.constants import DB, GENRES_TO_REFS1, DOC_TYPES
+from gere_ta_bib.models.search_index import index_notice, unindex_notice
+from gere_ta_bib.utils.constants import DB, GENRES_TO_REFS1, DOC_TYPES, EAN_CACHE_SIZE, SQL_BATCH_SIZE
+from gere_ta_bib.utils.exceptions import MultipleEANError
 
 
 # region Through differed models
@@ -26,6 +31,7 @@ class BaseNotice(Model):
     ref3 = CharField(max_length=10, null=True)
     _created_at = DateField()
     updated_at = DateField()
+    prefetched_artists = None  # artists fetched with the notice, if any (see EanResolver.get_notices)
 
     class Meta:
         database = DB
@@ -37,6 +43,39 @@ class BaseNotice(Model):
         """Document type (book, dvd, cd...)"""
         return ""
 
+    def delete_instance(self, *args, **kwargs):
+        unindex_notice(self)
+        return super().delete_instance(*args, **kwargs)
+
+    @classmethod
+    def get_artists_by_notice_id(cls, notices_ids: list[int] | None = None) -> dict[int, list]:
+        """
+        Get the artists of notices in one query, as a dict with notices ids as keys
+        :param notices_ids: ids of the notices (or a subquery selecting them), None for all notices
+        """
+        through_model = cls.artists.through_model
+        artist_model = cls.artists.rel_model
+        fk_by_model = {model: fk for fk, model in through_model._meta.refs.items()}
+        notice_fk, artist_fk = fk_by_model[cls], fk_by_model[artist_model]
+        query = (artist_model
+                 .select(artist_model, notice_fk.alias("notice_id"))
+                 .join(through_model, on=(artist_fk == artist_model.id))
+                 .order_by(through_model.id))
+        if notices_ids is not None:
+            query = query.where(notice_fk.in_(notices_ids))
+        artists_by_notice_id = {}
+        for artist in query.objects():
+            artists_by_notice_id.setdefault(artist.notice_id, []).append(artist)
+        return artists_by_notice_id
+
+    def get_artists(self) -> list:
+        """Get the artists of the notice (without query if they were prefetched)"""
+        return list(self.artists) if self.prefetched_artists is None else self.prefetched_artists
+
+    def get_completion_labels(self) -> list[str]:
+        """Labels proposed to complete the search prompt: title and series name"""
+        return [self.title, getattr(self, "series_name", None)]
+
     def get_ref1(self) -> str | None:
         """Get the first mark of classification from genre"""
         return GENRES_TO_REFS1.get(self.genre)
@@ -47,19 +86,34 @@ class BaseNotice(Model):
         DON'T CALL THIS FROM SAVE() METHOD,
         because 'artists' refers to a ManyToManyField that won't be resolved yet.
         """
-        if self.artists:
-            return self.artists[0].last_name.upper()[0:3]
+        artists = self.get_artists()
+        if artists:
+            return artists[0].last_name.upper()[0:3]
+
+    @classmethod
+    def link_artists(cls, artists_ids_by_notice_id: dict[int, list[int]]) -> None:
+        """Link notices to their artists, with one INSERT per SQL_BATCH_SIZE links"""
+        through_model = cls.artists.through_model
+        fk_by_model = {model: fk for fk, model in through_model._meta.refs.items()}
+        notice_fk, artist_fk = fk_by_model[cls], fk_by_model[cls.artists.rel_model]
+        rows = [(notice_id, artist_id)
+                for notice_id, artists_ids in artists_ids_by_notice_id.items() for artist_id in artists_ids]
+        for i in range(0, len(rows), SQL_BATCH_SIZE):
+            through_model.insert_many(rows[i:i + SQL_BATCH_SIZE], fields=[notice_fk, artist_fk]).execute()
 
     def save(self, *args, **kwargs) -> None:
         """
         To call when an instance is created or changed.
         Warning: field ref2 can't be completed from here because not resolved yet.
+        The search index is updated with the current artists of the notice.
         """
         if not self._created_at:
             self._created_at = date.today()
             self.ref1 = self.get_ref1()
         self.updated_at = date.today()
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        index_notice(self)
+        return result
 
     @staticmethod
     def withdraw_leading_article(text) -> str:
@@ -84,7 +138,7 @@ class BookNotice(BaseNotice):
 
     def __str__(self) -> str:
         """Return book title"""
-        return f"{str(self.title)}, de {" et ".join(str(author) for author in self.artists)}"
+        return f"{str(self.title)}, de {" et ".join(str(author) for author in self.get_artists())}"
 
     @property
     def doc_type(self) -> str:
@@ -115,7 +169,7 @@ class FilmNotice(BaseNotice):
 
     def __str__(self) -> str:
         """Return film title"""
-        return f"{str(self.title)}, de {" et ".join(str(director) for director in self.artists)}"
+        return f"{str(self.title)}, de {" et ".join(str(director) for director in self.get_artists())}"
 
     @property
     def doc_type(self) -> str:
@@ -132,7 +186,7 @@ class MusicNotice(BaseNotice):
 
     def __str__(self) -> str:
         """Return music title"""
-        return f"{str(self.title)}, de {" et ".join(str(musician) for musician in self.artists)}"
+        return f"{str(self.title)}, de {" et ".join(str(musician) for musician in self.get_artists())}"
 
     @property
     def doc_type(self) -> str:
@@ -180,3 +234,84 @@ NOTICES_MODELS = {
     FilmNotice: DOC_TYPES.get("film"),
     MusicNotice: DOC_TYPES.get("music"),
 }
+
+
+class EanResolver:
+    """
+    Find notices from EANs with one query on the unique EAN indexes of the notices tables.
+    Found notices types and ids are kept in a bounded LRU cache (disabled if cache_size is 0),
+    checked again each time they are used, so that changes made elsewhere are taken into account.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def get_keys(self, ean: str, use_cache: bool = True) -> list[tuple[str, int]]:
+        """Get the (doc_type, id) of all notices with this EAN (there should be at most one)"""
+        if use_cache and ean in self._cache:
+            self._cache.move_to_end(ean)
+            return [self._cache[ean]]
+        queries = [model.select(SQL("?", [doc_type]), model.id).where(model.ean == ean)
+                   for model, doc_type in NOTICES_MODELS.items()]
+        union = queries[0]
+        for query in queries[1:]:
+            union = union.union_all(query)
+        keys = list(union.tuples())
+        self._cache.pop(ean, None)
+        if len(keys) == 1:
+            self.set_key(ean, keys[0])
+        return keys
+
+    def get_notice(self, ean: str, use_cache: bool = True) -> BaseNotice | None | NoReturn:
+        """Get the notice with this EAN, None if not existing. Raise MultipleEANError if found in several tables."""
+        keys = self.get_keys(ean, use_cache)
+        if not keys:
+            return None
+        if len(keys) > 1:
+            raise MultipleEANError()
+        doc_type, notice_id = keys[0]
+        model = NOTICES_MODELS_BY_DOC_TYPE[doc_type]
+        notice = model.get_or_none(model.id == notice_id)
+        if use_cache and (notice is None or notice.ean != ean):  # notice deleted or changed since it was cached
+            return self.get_notice(ean, use_cache=False)
+        return notice
+
+    def get_notices(self, eans: list[str]) -> dict[str, BaseNotice] | NoReturn:
+        """
+        Get the notices of several EANs, with their artists prefetched, with two queries per notice model
+        (whatever the number of EANs, up to SQL_BATCH_SIZE). Unknown EANs are missing from the result.
+        Raise MultipleEANError if an EAN is found in several tables.
+        """
+        eans = list(set(eans))
+        notices_by_ean = {}
+        for model, doc_type in NOTICES_MODELS.items():
+            for i in range(0, len(eans), SQL_BATCH_SIZE):
+                notices = list(model.select().where(model.ean.in_(eans[i:i + SQL_BATCH_SIZE])))
+                if not notices:
+                    continue
+                artists_by_notice_id = model.get_artists_by_notice_id([notice.id for notice in notices])
+                for notice in notices:
+                    if notice.ean in notices_by_ean:
+                        raise MultipleEANError()
+                    notice.prefetched_artists = artists_by_notice_id.get(notice.id, [])
+                    notices_by_ean[notice.ean] = notice
+                    self.set_key(notice.ean, (doc_type, notice.id))
+        return notices_by_ean
+
+    def is_existing_ean(self, ean: str) -> bool:
+        """True if a notice has this EAN, False otherwise (always checked in database, then cached)"""
+        return bool(self.get_keys(ean, use_cache=False))
+
+    def set_key(self, ean: str, key: tuple[str, int]) -> None:
+        """Keep in cache the (doc_type, id) of the notice of an EAN (if the cache is enabled)"""
+        if not self.cache_size:
+            return
+        self._cache[ean] = key
+        self._cache.move_to_end(ean)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+NOTICES_MODELS_BY_DOC_TYPE = {doc_type: model for model, doc_type in NOTICES_MODELS.items()}
+EAN_RESOLVER = EanResolver(EAN_CACHE_SIZE)
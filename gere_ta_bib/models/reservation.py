@@ -3,13 +3,13 @@
 from datetime import date, timedelta
 from typing import NoReturn
 
-from peewee import CharField, DateField
+from peewee import CharField, DateField, Case
 
-from gere_ta_bib.models.notices import BaseNotice, BookNotice, FilmNotice, MusicNotice
+from gere_ta_bib.models.copies import select_notices_eans
+from gere_ta_bib.models.notices import BaseNotice, EAN_RESOLVER
 from gere_ta_bib.models.transaction import AbstractTransaction
 from gere_ta_bib.utils.constants import ReservationStatuses, Periods, MAX_NB_OF_RESERVATIONS
-from gere_ta_bib.utils.exceptions import UnkonowEANError, MultipleEANError, AlreadyReservedBySelfError, \
-    MaxNbOfReservationsError
+from gere_ta_bib.utils.exceptions import UnkonowEANError, AlreadyReservedBySelfError, MaxNbOfReservationsError
 
 
 class Reservation(AbstractTransaction):
@@ -20,27 +20,19 @@ class Reservation(AbstractTransaction):
     availability_date = DateField(null=True)
     pickup_date = DateField(null=True)
     status = CharField(max_length=25, default=ReservationStatuses.PENDING)
+    prefetched_notice = None  # notice fetched with the reservation, if any (see prefetch_notices)
 
     class Meta:
         table_name = "Réservations"
 
     @property
     def notice(self) -> BaseNotice | NoReturn:
-        book_notice_exists = BookNotice.select().where(BookNotice.ean == self.ean).exists()
-        film_notice_exists = FilmNotice.select().where(FilmNotice.ean == self.ean).exists()
-        music_notice_exists = MusicNotice.select().where(MusicNotice.ean == self.ean).exists()
-
-        match (book_notice_exists, film_notice_exists, music_notice_exists):
-            case (True, False, False):
-                return BookNotice.get(BookNotice.ean == self.ean)
-            case (False, True, False):
-                return FilmNotice.get(FilmNotice.ean == self.ean)
-            case (False, False, True):
-                return MusicNotice.get(MusicNotice.ean == self.ean)
-            case (False, False, False):
-                raise UnkonowEANError()
-            case _:
-                raise MultipleEANError()
+        if self.prefetched_notice is not None:
+            return self.prefetched_notice
+        notice = EAN_RESOLVER.get_notice(self.ean)
+        if notice is None:
+            raise UnkonowEANError()
+        return notice
 
     @classmethod
     def has_already_a_current_reservation_of_this(cls, card_number: str, ean: str) -> bool:
@@ -59,6 +51,89 @@ class Reservation(AbstractTransaction):
             (cls.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE]))
         ).count() >= MAX_NB_OF_RESERVATIONS)
 
+    @classmethod
+    def assign_returned_copies(cls, barcodes: list[str]) -> list[tuple[str, "Reservation"]]:
+        """
+        Make available, for each returned copy, the first pending reservation of its notice
+        (one returned copy for one reservation), with a constant number of queries.
+        :return: list of (barcode, reservation) of the copies to put on the hold shelf
+        """
+        eans_by_barcode = dict(select_notices_eans(barcodes, with_barcodes=True).tuples())
+        pending_by_ean = {}
+        for reservation in (cls
+                            .select()
+                            .where(cls.ean.in_(list(set(eans_by_barcode.values())))
+                                   & (cls.status == ReservationStatuses.PENDING))
+                            .order_by(cls.id)):
+            pending_by_ean.setdefault(reservation.ean, []).append(reservation)
+        holds = [(barcode, pending_by_ean[eans_by_barcode[barcode]].pop(0)) for barcode in barcodes
+                 if pending_by_ean.get(eans_by_barcode.get(barcode))]
+        if holds:
+            today = date.today()
+            (cls
+             .update(availability_date=today, status=ReservationStatuses.AVAILABLE)
+             .where(cls.id.in_([reservation.id for _, reservation in holds]))
+             .execute())
+            for _, reservation in holds:
+                reservation.availability_date = today
+                reservation.status = ReservationStatuses.AVAILABLE
+        return holds
+
+    @classmethod
+    def is_copy_reserved_by(cls, barcode: str, card_number: str) -> bool:
+        """True if user has a pending or available reservation of the notice of a copy (one query)"""
+        return cls.select().where(
+            (cls.card_number == card_number) &
+            (cls.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE])) &
+            (cls.ean.in_(select_notices_eans([barcode])))
+        ).exists()
+
+    @classmethod
+    def pick_up(cls, card_number: str, barcodes: list[str]) -> int:
+        """
+        Set as satisfied the pending or available reservations of a user for the notices of borrowed copies,
+        with one UPDATE. Return the number of satisfied reservations.
+        """
+        return (cls
+                .update(pickup_date=date.today(), status=ReservationStatuses.SATISFIED)
+                .where((cls.card_number == card_number) &
+                       (cls.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE])) &
+                       (cls.ean.in_(select_notices_eans(barcodes))))
+                .execute())
+
+    @staticmethod
+    def prefetch_notices(reservations: list["Reservation"]) -> list["Reservation"]:
+        """Fetch the notices (and their artists) of reservations with a constant number of queries"""
+        notices_by_ean = EAN_RESOLVER.get_notices([reservation.ean for reservation in reservations])
+        for reservation in reservations:
+            reservation.prefetched_notice = notices_by_ean.get(reservation.ean)
+        return reservations
+
+    @classmethod
+    def refresh_statuses(cls, since: date | None = None) -> int:
+        """
+        Set the status of pending and available reservations with one UPDATE (same rules as set_status).
+        Return the number of changed reservations.
+        :param since: date of the last refresh: only reservations which expired or were not picked up in time
+        since then are updated (range scans on the expiration and availability dates).
+        None to check all pending and available reservations.
+        """
+        today = date.today()
+        pickup_delta = timedelta(days=Periods.RESERVATION_PICKUP)
+        new_status = Case(None, [
+            (cls.pickup_date.is_null(False), ReservationStatuses.SATISFIED),
+            (cls.availability_date < today - pickup_delta, ReservationStatuses.UNCLAIMED),
+            (cls.availability_date.is_null(False), ReservationStatuses.AVAILABLE),
+            (cls.expiration_date < today, ReservationStatuses.EXPIRED),
+        ], ReservationStatuses.PENDING)
+        condition = (cls.status.in_([ReservationStatuses.PENDING, ReservationStatuses.AVAILABLE])
+                     & (cls.status != new_status))
+        if since:
+            condition &= (((cls.expiration_date >= since) & (cls.expiration_date < today))
+                          | ((cls.availability_date >= since - pickup_delta)
+                             & (cls.availability_date < today - pickup_delta)))
+        return cls.update(status=new_status).where(condition).execute()
+
     @classmethod
     def reserve(cls, card_number: str, ean: str) -> None | NoReturn:
         """Create a reservation if authorized, alse raise an error"""
@@ -0,0 +1,104 @@
+"""Model for the optional full-text search engine (SQLite FTS5), with BM25 relevance ranking"""
+from functools import cache
+
+from peewee import Model
+from playhouse.sqlite_ext import FTS5Model, SearchField
+
+from gere_ta_bib.utils.constants import DB, DOC_TYPES_NAMES
+from gere_ta_bib.utils.text import get_normalized_words
+
+
+class NoticeFTS(FTS5Model):
+    """
+    Full-text document of a notice. Texts are stored normalized (see get_normalized_words),
+    so that diacritics are folded the same way as in the other search engines.
+    The rowid is computed from the notice id and type (see get_fts_rowid).
+    """
+    doc_type = SearchField(unindexed=True)
+    notice_id = SearchField(unindexed=True)
+    title = SearchField()
+    series_name = SearchField()
+    genre = SearchField()
+    publisher = SearchField()
+    artists = SearchField()
+
+    class Meta:
+        database = DB
+        table_name = "Index - FTS"
+        options = {"tokenize": "unicode61 remove_diacritics 0"}
+
+
+def create_fts_index() -> bool:
+    """Create the full-text table if possible and not existing yet. True if it has just been created."""
+    if not is_fts5_available() or NoticeFTS.table_exists():
+        return False
+    NoticeFTS.create_table()
+    return True
+
+
+def fts_index_notice(notice: Model, artists: list | None = None) -> None:
+    """Replace the full-text document of a notice. Artists can be given if they were already fetched."""
+    if is_fts5_available():
+        NoticeFTS.replace(**get_fts_row(notice, artists)).execute()
+
+
+def fts_unindex_notice(notice: Model) -> None:
+    """Remove the full-text document of a notice"""
+    if is_fts5_available():
+        NoticeFTS.delete().where(NoticeFTS.rowid == get_fts_rowid(notice.doc_type, notice.id)).execute()
+
+
+def get_fts_row(notice: Model, artists: list | None = None) -> dict:
+    """Get the full-text document of a notice. Artists can be given if they were already fetched."""
+    publisher = getattr(notice, "publisher", None)
+    artists = notice.artists if artists is None else artists
+    return {
+        "rowid": get_fts_rowid(notice.doc_type, notice.id),
+        "doc_type": notice.doc_type,
+        "notice_id": notice.id,
+        "title": normalize(notice.title),
+        "series_name": normalize(getattr(notice, "series_name", None)),
+        "genre": normalize(notice.genre),
+        "publisher": normalize(publisher.name if publisher else None),
+        "artists": " ".join(normalize(f"{artist.first_name or ''} {artist.last_name}") for artist in artists),
+    }
+
+
+def get_fts_rowid(doc_type: str, notice_id: int) -> int:
+    """
+    Get a unique rowid for a notice, from its type and id
+    >>> get_fts_rowid("DVD", 12)
+    37
+    """
+    return notice_id * len(DOC_TYPES_NAMES) + DOC_TYPES_NAMES.index(doc_type)
+
+
+@cache
+def is_fts5_available() -> bool:
+    """True if the SQLite library has the FTS5 extension, False otherwise"""
+    return NoticeFTS.fts5_installed()
+
+
+def normalize(text: str | None) -> str:
+    """
+    Normalize a text to be stored in (or searched with) the full-text engine
+    >>> normalize("Les Misérables")
+    'les miserables'
+    """
+    return " ".join(get_normalized_words(text)) if text else ""
+
+
+def search_notices_fts(words: list[str]) -> list[tuple[str, int]]:
+    """
+    Get notices containing all the (normalized) words, sorted by relevance (BM25).
+    Return (doc_type, notice id) keys.
+    """
+    if not words:
+        return []
+    expression = " ".join(f'"{word}"' for word in set(words))
+    ranked = (NoticeFTS
+              .select(NoticeFTS.doc_type, NoticeFTS.notice_id)
+              .where(NoticeFTS.match(expression))
+              .order_by(NoticeFTS.bm25())
+              .tuples())
+    return [(doc_type, int(notice_id)) for doc_type, notice_id in ranked]
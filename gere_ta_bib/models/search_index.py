@@ -0,0 +1,278 @@
+"""
+Models for the catalog search index: normalized words -> notices (posting lists),
+and trigrams -> words (for typo-tolerant searches)
+"""
+import operator
+from functools import reduce
+
+from peewee import Model, Case, CharField, IntegerField, ForeignKeyField, JOIN, fn, SQL
+
+from gere_ta_bib.models.search_fts import (NoticeFTS, create_fts_index, fts_index_notice, fts_unindex_notice,
+                                           get_fts_row, is_fts5_available)
+from gere_ta_bib.utils.completion import CATALOG_COMPLETIONS
+from gere_ta_bib.utils.constants import DB, SEARCH_INDEX_CHUNK_SIZE, FUZZY_MIN_SIMILARITY, FUZZY_MAX_CANDIDATES, \
+    FUZZY_MAX_RESULTS
+from gere_ta_bib.utils.text import get_normalized_words, get_trigrams, get_trigrams_similarity
+
+
+class NoticeToken(Model):
+    """A posting: a normalized word found in a notice, its publisher or its artists"""
+    token = CharField(max_length=255)
+    doc_type = CharField(max_length=3)
+    notice_id = IntegerField()
+
+    class Meta:
+        database = DB
+        table_name = "Index - MOTS"
+        indexes = (
+            (("token", "doc_type", "notice_id"), True),
+            (("doc_type", "notice_id"), False),
+        )
+
+
+class TokenTrigram(Model):
+    """A trigram of a word of the index. Words no longer in any notice are ignored when searching."""
+    trigram = CharField(max_length=3)
+    token = CharField(max_length=255)
+
+    class Meta:
+        database = DB
+        table_name = "Index - TRIGRAMMES"
+        indexes = (
+            (("trigram", "token"), True),
+        )
+
+
+def add_tokens_trigrams(tokens: set[str]) -> None:
+    """Add the trigrams of words to the trigrams index (if not already there)"""
+    tokens = list(tokens)
+    known_tokens = set()
+    for i in range(0, len(tokens), SEARCH_INDEX_CHUNK_SIZE):
+        known_tokens.update(token for token, in (TokenTrigram
+                                                 .select(TokenTrigram.token)
+                                                 .where(TokenTrigram.token.in_(tokens[i:i + SEARCH_INDEX_CHUNK_SIZE]))
+                                                 .distinct()
+                                                 .tuples()))
+    rows = [(trigram, token) for token in tokens if token not in known_tokens for trigram in get_trigrams(token)]
+    for i in range(0, len(rows), SEARCH_INDEX_CHUNK_SIZE):
+        (TokenTrigram
+         .insert_many(rows[i:i + SEARCH_INDEX_CHUNK_SIZE], fields=[TokenTrigram.trigram, TokenTrigram.token])
+         .on_conflict_ignore()
+         .execute())
+
+
+def build_completions(models) -> None:
+    """Build the in-memory completions of the search prompt, with one query per model"""
+    CATALOG_COMPLETIONS.build({get_completion_owner(instance): instance.get_completion_labels()
+                               for model in models for instance in model.select()})
+
+
+def build_search_index(notices_models) -> None:
+    """(Re)build the whole search indexes, with a constant number of queries per notice model"""
+    with DB.atomic():
+        NoticeToken.delete().execute()
+        TokenTrigram.delete().execute()
+        if is_fts5_available():
+            NoticeFTS.delete().execute()
+        for model in notices_models:
+            index_new_notices(list(select_with_foreign_keys(model)), model.get_artists_by_notice_id())
+
+
+def create_search_index(notices_models) -> None:
+    """Create and fill the search indexes if they don't exist yet in the database"""
+    created = False
+    for model in (NoticeToken, TokenTrigram):
+        if not model.table_exists():
+            model.create_table()
+            created = True
+    if create_fts_index():
+        created = True
+    if created:
+        build_search_index(notices_models)
+
+
+def get_completion_owner(instance: Model) -> tuple[str, int]:
+    """Get the key under which the completions of an instance are stored"""
+    return instance._meta.table_name, instance.id
+
+
+def get_contributor_notices(contributor: Model) -> list:
+    """Get all notices linked to a contributor (through a ManyToManyField or a ForeignKeyField)"""
+    notices = []
+    for m2m_field in contributor._meta.manytomany.values():
+        notices.extend(getattr(contributor, m2m_field.name))
+    for fk_field, model in contributor._meta.backrefs.items():
+        if hasattr(model, "doc_type"):
+            notices.extend(model.select().where(fk_field == contributor.id))
+    return notices
+
+
+def get_notices_from_keys(keys: list[tuple[str, int]], notices_models) -> list:
+    """Get notices from a list of (doc_type, notice id), in the same order, with few queries"""
+    notices_by_key = {}
+    for model, doc_type in notices_models.items():
+        ids = [notice_id for notice_type, notice_id in keys if notice_type == doc_type]
+        for i in range(0, len(ids), SEARCH_INDEX_CHUNK_SIZE):
+            for notice in model.select().where(model.id.in_(ids[i:i + SEARCH_INDEX_CHUNK_SIZE])):
+                notices_by_key[(doc_type, notice.id)] = notice
+    return [notices_by_key[key] for key in keys if key in notices_by_key]
+
+
+def get_instance_tokens(instance: Model, artists: list | None = None) -> set[str]:
+    """
+    Get the normalized words of the charfields of an instance, and of the charfields of its related instances
+    (foreign keys and artists). Artists can be given if they were already fetched.
+    """
+    tokens = set()
+    for field_name, field_type in instance._meta.fields.items():
+        if isinstance(field_type, CharField):
+            field_value = getattr(instance, field_name)
+            if field_value:
+                tokens.update(get_normalized_words(field_value))
+        if isinstance(field_type, ForeignKeyField):
+            related_instance = getattr(instance, field_name)
+            if related_instance:
+                tokens.update(get_instance_tokens(related_instance))
+    if hasattr(instance, "artists"):
+        for artist in (instance.artists if artists is None else artists):
+            tokens.update(get_instance_tokens(artist))
+    return tokens
+
+
+def get_similar_tokens(word: str) -> dict[str, float]:
+    """
+    Get the words of the index similar to a word, with their similarity.
+    Only the FUZZY_MAX_CANDIDATES words still in a notice sharing the most trigrams with the word are considered,
+    so the cost doesn't depend on the catalog size.
+    """
+    trigrams = get_trigrams(word)
+    candidates = (TokenTrigram
+                  .select(TokenTrigram.token, fn.COUNT(TokenTrigram.trigram).alias("nb_shared"))
+                  .where(TokenTrigram.trigram.in_(trigrams)
+                         & fn.EXISTS(NoticeToken.select().where(NoticeToken.token == TokenTrigram.token)))
+                  .group_by(TokenTrigram.token)
+                  .order_by(SQL("nb_shared").desc())
+                  .limit(FUZZY_MAX_CANDIDATES)
+                  .tuples())
+    similar_tokens = {}
+    for token, _ in candidates:
+        similarity = get_trigrams_similarity(word, token)
+        if similarity >= FUZZY_MIN_SIMILARITY:
+            similar_tokens[token] = similarity
+    return similar_tokens
+
+
+def index_contributor(contributor: Model) -> None:
+    """Update the completions of a contributor, and the search indexes of all its notices"""
+    CATALOG_COMPLETIONS.set_labels(get_completion_owner(contributor), contributor.get_completion_labels())
+    index_notices(get_contributor_notices(contributor))
+
+
+def index_notice(notice: Model) -> None:
+    """Replace the postings (and the full-text document) of a notice by its current words"""
+    artists = list(notice.artists)
+    rows = [(token, notice.doc_type, notice.id) for token in get_instance_tokens(notice, artists)]
+    with DB.atomic():
+        NoticeToken.delete().where((NoticeToken.doc_type == notice.doc_type)
+                                   & (NoticeToken.notice_id == notice.id)).execute()
+        if rows:
+            NoticeToken.insert_many(rows, fields=[NoticeToken.token, NoticeToken.doc_type,
+                                                  NoticeToken.notice_id]).execute()
+        add_tokens_trigrams({token for token, _, _ in rows})
+        fts_index_notice(notice, artists)
+    CATALOG_COMPLETIONS.set_labels(get_completion_owner(notice), notice.get_completion_labels())
+
+
+def index_new_notices(notices: list, artists_by_notice_id: dict[int, list]) -> None:
+    """
+    Add the postings (and the full-text documents) of notices not indexed yet, with one INSERT
+    per SEARCH_INDEX_CHUNK_SIZE rows. Their foreign keys and their artists must have been fetched.
+    """
+    rows = [(token, notice.doc_type, notice.id)
+            for notice in notices
+            for token in get_instance_tokens(notice, artists_by_notice_id.get(notice.id, []))]
+    for i in range(0, len(rows), SEARCH_INDEX_CHUNK_SIZE):
+        NoticeToken.insert_many(rows[i:i + SEARCH_INDEX_CHUNK_SIZE],
+                                fields=[NoticeToken.token, NoticeToken.doc_type, NoticeToken.notice_id]).execute()
+    add_tokens_trigrams({token for token, _, _ in rows})
+    if is_fts5_available():
+        fts_rows = [get_fts_row(notice, artists_by_notice_id.get(notice.id, [])) for notice in notices]
+        for i in range(0, len(fts_rows), SEARCH_INDEX_CHUNK_SIZE):
+            NoticeFTS.insert_many(fts_rows[i:i + SEARCH_INDEX_CHUNK_SIZE]).execute()
+
+
+def index_notices(notices: list) -> None:
+    """Update the search index for several notices"""
+    with DB.atomic():
+        for notice in notices:
+            index_notice(notice)
+
+
+def set_completions(instances: list) -> None:
+    """Set the completions of several instances (notices or contributors), without query"""
+    for instance in instances:
+        CATALOG_COMPLETIONS.set_labels(get_completion_owner(instance), instance.get_completion_labels())
+
+
+def remove_completions(instance: Model) -> None:
+    """Remove the completions of an instance"""
+    CATALOG_COMPLETIONS.remove(get_completion_owner(instance))
+
+
+def search_notices(words: list[str], notices_models) -> list:
+    """
+    Get notices containing all the (normalized) words, with one query per notice model
+    (posting lists intersection on the index). Notices are sorted by model, then by id.
+    """
+    words = set(words)
+    if not words:
+        return []
+    notices = []
+    for model, doc_type in notices_models.items():
+        matching_ids = (NoticeToken
+                        .select(NoticeToken.notice_id)
+                        .where(NoticeToken.token.in_(words) & (NoticeToken.doc_type == doc_type))
+                        .group_by(NoticeToken.notice_id)
+                        .having(fn.COUNT(NoticeToken.token.distinct()) == len(words)))
+        notices.extend(model.select().where(model.id.in_(matching_ids)).order_by(model.id))
+    return notices
+
+
+def search_notices_fuzzy(words: list[str]) -> list[tuple[str, int]]:
+    """
+    Get notices containing, for each word, at least one similar word (typo-tolerant search).
+    Return the (doc_type, notice id) keys of the FUZZY_MAX_RESULTS best notices, sorted by decreasing similarity
+    (sum of the best similarity for each word), with one grouped query.
+    """
+    similar_tokens_by_word = [get_similar_tokens(word) for word in set(words)]
+    if not similar_tokens_by_word or not all(similar_tokens_by_word):
+        return []
+    all_similar_tokens = set().union(*similar_tokens_by_word)
+    best_similarities = [fn.MAX(Case(NoticeToken.token, list(similar_tokens.items()), 0.))
+                         for similar_tokens in similar_tokens_by_word]
+    score = sum(best_similarities[1:], best_similarities[0])
+    return list(NoticeToken
+                .select(NoticeToken.doc_type, NoticeToken.notice_id)
+                .where(NoticeToken.token.in_(all_similar_tokens))
+                .group_by(NoticeToken.doc_type, NoticeToken.notice_id)
+                .having(reduce(operator.and_, [similarity > 0 for similarity in best_similarities]))
+                .order_by(score.desc(), NoticeToken.doc_type, NoticeToken.notice_id)
+                .limit(FUZZY_MAX_RESULTS)
+                .tuples())
+
+
+def select_with_foreign_keys(model):
+    """Select all instances of a model, with the related instances of its foreign keys in the same query"""
+    foreign_keys = [field for field in model._meta.fields.values() if isinstance(field, ForeignKeyField)]
+    query = model.select(model, *[field.rel_model for field in foreign_keys])
+    for field in foreign_keys:
+        query = query.join_from(model, field.rel_model, JOIN.LEFT_OUTER, on=field)
+    return query
+
+
+def unindex_notice(notice: Model) -> None:
+    """Remove all postings (and the full-text document, and the completions) of a notice"""
+    NoticeToken.delete().where((NoticeToken.doc_type == notice.doc_type)
+                               & (NoticeToken.notice_id == notice.id)).execute()
+    fts_unindex_notice(notice)
+    remove_completions(notice)
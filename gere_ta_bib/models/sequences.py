@@ -0,0 +1,43 @@
+"""Model for persistent sequences, used to allocate unique numbers (copies barcodes, cards numbers...)"""
+from typing import Callable, NoReturn
+
+from peewee import Model, CharField, IntegerField
+
+from gere_ta_bib.utils.constants import DB
+from gere_ta_bib.utils.exceptions import ValidationError
+
+
+class Sequence(Model):
+    """A named sequence, with the last allocated value"""
+    name = CharField(max_length=50, unique=True)
+    last_value = IntegerField()
+
+    class Meta:
+        database = DB
+        table_name = "Séquences"
+
+    @classmethod
+    def allocate(cls, name: str, get_initial_value: Callable[[], int], nb: int = 1,
+                 max_value: int | None = None) -> int | NoReturn:
+        """
+        Reserve a block of nb consecutive values in a sequence, and return the first one.
+        If the sequence doesn't exist yet, it starts after get_initial_value() (for example the highest existing value),
+        which is only called then.
+        If the block would go beyond max_value, nothing is reserved and a ValidationError is raised.
+        The block is reserved with a single UPDATE statement, in an immediate transaction (to call outside
+        of any transaction, else it is only a savepoint): several processes can allocate values at the same time
+        without getting the same ones.
+        """
+        with DB.atomic("IMMEDIATE"):
+            sequence = cls.get_or_none(cls.name == name)
+            if sequence is None:
+                sequence = cls.create(name=name, last_value=get_initial_value())
+            if max_value is not None and sequence.last_value + nb > max_value:
+                raise ValidationError(f"Séquence '{name}': plus que {max(max_value - sequence.last_value, 0)} "
+                                      f"valeur(s) disponible(s), {nb} demandée(s).")
+            last_value = (cls
+                          .update(last_value=cls.last_value + nb)
+                          .where(cls.name == name)
+                          .returning(cls.last_value)
+                          .execute()[0].last_value)
+        return last_value - nb + 1
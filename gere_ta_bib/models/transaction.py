@@ -1,19 +1,31 @@
 """Models for transactions"""
 
 from datetime import timedelta, date
-from typing import NoReturn
+from typing import NoReturn, NamedTuple
 
-from peewee import Model, DateField, IntegerField, CharField, BooleanField
+from peewee import Model, DateField, IntegerField, CharField, BooleanField, SQL
 
-from gere_ta_bib.models.copies import BookCopy, FilmCopy, MusicCopy, BaseCopy
+from gere_ta_bib.models.copies import BaseCopy, CopyBarcode, COPIES_MODELS_DOC_TYPES
+from gere_ta_bib.models.notices import NOTICES_MODELS_BY_DOC_TYPE
 from gere_ta_bib.models.users import User
 from gere_ta_bib.utils.constants import MAX_NB_OF_RENEWALS, Periods, DB, RENEWAL_NB_OF_DAYS_ADDED_TO_TODAY, \
     MAX_NB_OF_LOANS
 from gere_ta_bib.utils.exceptions import CopyBorrowedTodayError, MaxNbOfRenewalsError, UnkonowCopyBarcodeError, \
-    MultipleCopyBarcodeError, \
     NotBorrowedCopyError, AlreadyBorrowedBySelfError, ReturnedTodayError, AlreadyBorrowedByOtherError, MaxNbOfLoansError
 
 
+class BorrowedCopy(NamedTuple):
+    """A currently borrowed copy, with what is needed to display it (lighter than a copy and its notice)"""
+    barcode: str
+    title: str
+    artists: tuple[str, ...]
+    due_date: date
+
+    def __str__(self) -> str:
+        """Return title, artists and barcode, like a copy"""
+        return f"{self.title}, de {" et ".join(self.artists)} (n°{self.barcode})"
+
+
 class AbstractTransaction(Model):
     card_number = CharField(max_length=9)
 
@@ -41,21 +53,10 @@ class Transaction(AbstractTransaction):
 
     @property
     def copy(self) -> BaseCopy | NoReturn:
-        book_copy_exists = BookCopy.select().where(BookCopy.barcode == self.barcode).exists()
-        film_copy_exists = FilmCopy.select().where(FilmCopy.barcode == self.barcode).exists()
-        music_copy_exists = MusicCopy.select().where(MusicCopy.barcode == self.barcode).exists()
-
-        match (book_copy_exists, film_copy_exists, music_copy_exists):
-            case (True, False, False):
-                return BookCopy.get(BookCopy.barcode == self.barcode)
-            case (False, True, False):
-                return FilmCopy.get(FilmCopy.barcode == self.barcode)
-            case (False, False, True):
-                return MusicCopy.get(MusicCopy.barcode == self.barcode)
-            case (False, False, False):
-                raise UnkonowCopyBarcodeError()
-            case _:
-                raise MultipleCopyBarcodeError()
+        copy = CopyBarcode.get_copy(self.barcode)
+        if copy is None:
+            raise UnkonowCopyBarcodeError()
+        return copy
 
     def __str__(self) -> str:
         """Return transactions infos"""
@@ -81,6 +82,123 @@ class Transaction(AbstractTransaction):
             barcode=barcode,
         )
 
+    @classmethod
+    def borrow_many(cls, card_number: str, barcodes: list[str]) -> dict[str, Exception | None]:
+        """
+        Borrow several copies at once (same rules as borrow_copy), with a constant number of queries:
+        the batch is checked with set queries, then all loans are created with one INSERT.
+        The maximal number of loans is checked once for the whole batch: copies beyond it are not borrowed.
+        :return: dict with barcodes (without duplicates, in the same order) as keys, and as values None if the copy
+        was borrowed, or the error explaining why it wasn't (UnkonowCopyBarcodeError, AlreadyBorrowedBySelfError,
+        AlreadyBorrowedByOtherError, ReturnedTodayError or MaxNbOfLoansError)
+        """
+        barcodes = list(dict.fromkeys(barcodes))
+        today = date.today()
+        with DB.atomic("IMMEDIATE"):  # write lock taken before the checks, so that they stay true until the INSERT
+            known = {barcode for barcode, in (CopyBarcode
+                                              .select(CopyBarcode.barcode)
+                                              .where(CopyBarcode.barcode.in_(barcodes))
+                                              .tuples())}
+            current_borrowers = dict(cls
+                                     .select(cls.barcode, cls.card_number)
+                                     .where(cls.barcode.in_(barcodes) & cls.return_date.is_null())
+                                     .tuples())
+            returned_today = {barcode for barcode, in (cls
+                                                       .select(cls.barcode)
+                                                       .where((cls.card_number == card_number)
+                                                              & cls.barcode.in_(barcodes)
+                                                              & (cls.return_date == today))
+                                                       .tuples())}
+            nb_of_loans_left = MAX_NB_OF_LOANS - (cls
+                                                  .select()
+                                                  .where((cls.card_number == card_number) & cls.return_date.is_null())
+                                                  .count())
+            outcomes = {}
+            for barcode in barcodes:
+                if barcode not in known:
+                    outcomes[barcode] = UnkonowCopyBarcodeError()
+                elif barcode in current_borrowers:
+                    outcomes[barcode] = (AlreadyBorrowedBySelfError() if current_borrowers[barcode] == card_number
+                                         else AlreadyBorrowedByOtherError())
+                elif barcode in returned_today:
+                    outcomes[barcode] = ReturnedTodayError()
+                elif nb_of_loans_left <= 0:
+                    outcomes[barcode] = MaxNbOfLoansError()
+                else:
+                    outcomes[barcode] = None
+                    nb_of_loans_left -= 1
+            to_borrow = [barcode for barcode, error in outcomes.items() if error is None]
+            if to_borrow:
+                borrower = User.get(User.card_number == card_number)
+                due_date = today + timedelta(days=Periods.STANDARD_USER_BORROW if not borrower.is_staff
+                                             else Periods.STAFF_BORROW)
+                cls.insert_many([{cls.card_number: card_number, cls.barcode: barcode, cls.borrow_date: today,
+                                  cls.due_date: due_date, cls.nb_of_renewals: 0, cls.overdue: False}
+                                 for barcode in to_borrow]).execute()
+        return outcomes
+
+    @classmethod
+    def close_current_loans(cls, barcodes: list[str]) -> int:
+        """Set today as return date of the current loans of copies, with one UPDATE. Return the number of loans."""
+        return (cls
+                .update(return_date=date.today(), overdue=False)
+                .where(cls.barcode.in_(barcodes) & cls.return_date.is_null())
+                .execute())
+
+    @classmethod
+    def return_many(cls, barcodes: list[str]) -> dict[str, Exception | None]:
+        """
+        Return several copies at once (for example a return box), with a constant number of queries.
+        :return: dict with barcodes (without duplicates, in the same order) as keys, and as values None if the copy
+        was returned, or the error explaining why it wasn't (UnkonowCopyBarcodeError or NotBorrowedCopyError)
+        """
+        barcodes = list(dict.fromkeys(barcodes))
+        with DB.atomic("IMMEDIATE"):
+            known = {barcode for barcode, in (CopyBarcode
+                                              .select(CopyBarcode.barcode)
+                                              .where(CopyBarcode.barcode.in_(barcodes))
+                                              .tuples())}
+            borrowed = {barcode for barcode, in (cls
+                                                 .select(cls.barcode)
+                                                 .where(cls.barcode.in_(barcodes) & cls.return_date.is_null())
+                                                 .tuples())}
+            outcomes = {barcode: (None if barcode in borrowed
+                                  else UnkonowCopyBarcodeError() if barcode not in known
+                                  else NotBorrowedCopyError())
+                        for barcode in barcodes}
+            cls.close_current_loans([barcode for barcode, error in outcomes.items() if error is None])
+        return outcomes
+
+    @classmethod
+    def get_borrowed_copies(cls, card_number: str) -> list[BorrowedCopy]:
+        """
+        Get the copies currently borrowed by a user, in borrowing order, with a constant number of queries:
+        one for the loans, their copies and notices (UNION of the copies tables), and one per notice model
+        for the artists.
+        """
+        queries = []
+        for copy_model, doc_type in COPIES_MODELS_DOC_TYPES.items():
+            notice_model = copy_model.parent_notice.rel_model
+            queries.append(cls
+                           .select(cls.id, cls.barcode, cls.due_date, SQL("?", [doc_type]),
+                                   notice_model.id, notice_model.title)
+                           .join(copy_model, on=(copy_model.barcode == cls.barcode))
+                           .join(notice_model, on=(copy_model.parent_notice == notice_model.id))
+                           .where((cls.card_number == card_number) & cls.return_date.is_null()))
+        union = queries[0]
+        for query in queries[1:]:
+            union = union.union_all(query)
+        loans = sorted(union.tuples())
+        artists_by_key = {}
+        for doc_type, model in NOTICES_MODELS_BY_DOC_TYPE.items():
+            notices_ids = [notice_id for _, _, _, loan_doc_type, notice_id, _ in loans if loan_doc_type == doc_type]
+            if notices_ids:
+                for notice_id, artists in model.get_artists_by_notice_id(notices_ids).items():
+                    artists_by_key[(doc_type, notice_id)] = tuple(str(artist) for artist in artists)
+        return [BorrowedCopy(barcode, title, artists_by_key.get((doc_type, notice_id), ()),
+                             cls.due_date.python_value(due_date))
+                for _, barcode, due_date, doc_type, notice_id, title in loans]
+
     @classmethod
     def get_current_borrower(cls, barcode: str) -> str | None:
         """
@@ -110,6 +228,19 @@ class Transaction(AbstractTransaction):
             (cls.return_date.is_null())
         ).count() >= MAX_NB_OF_LOANS)
 
+    @classmethod
+    def refresh_overdues(cls, since: date | None = None) -> int:
+        """
+        Set the overdue status of current loans with one UPDATE. Return the number of changed loans.
+        :param since: date of the last refresh: only loans which became overdue since then are updated
+        (range scan on the due date). None to check all current loans.
+        """
+        is_overdue = cls.due_date < date.today()
+        condition = cls.return_date.is_null() & (cls.overdue != is_overdue)
+        if since:
+            condition &= (cls.due_date >= since) & is_overdue
+        return cls.update(overdue=is_overdue).where(condition).execute()
+
     def renew_borrow(self) -> None | NoReturn:
         """Renew borrow if renewal is authorized, raise an error otherwise"""
         if self.borrow_date == date.today():
@@ -2,9 +2,10 @@
 from datetime import timedelta, date
 from typing import NoReturn
 
-from peewee import Model, CharField, BooleanField, DateTimeField, DateField
+from peewee import Model, CharField, BooleanField, DateTimeField, DateField, fn
 
-from gere_ta_bib.utils.constants import Periods, DB, MINIMAL_CARD_NUMBER
+from gere_ta_bib.models.sequences import Sequence
+from gere_ta_bib.utils.constants import Periods, DB, MINIMAL_CARD_NUMBER, MAXIMAL_CARD_NUMBER, CARD_NUMBER_SEQUENCE
 from gere_ta_bib.utils.exceptions import NotExistingFieldsError
 
 
@@ -29,14 +30,43 @@ class User(Model):
     @classmethod
     def generate_unique_card_number(cls) -> str:
         """Generate a valid and unique user card number"""
-        card_numbers = [user.card_number for user in cls.select()]
-        highest = max([int(card_number) for card_number in card_numbers]) if card_numbers else MINIMAL_CARD_NUMBER
-        return str(highest + 1)
+        return cls.reserve_card_numbers(1)[0]
+
+    @classmethod
+    def get_highest_card_number(cls) -> int:
+        """
+        Get the highest card number of all users, as an integer (at least MINIMAL_CARD_NUMBER).
+        Card numbers have a fixed width, so the highest one is found on the index.
+        """
+        highest = cls.select(fn.MAX(cls.card_number)).scalar()
+        return max(int(highest or MINIMAL_CARD_NUMBER), MINIMAL_CARD_NUMBER)
+
+    @classmethod
+    def refresh_active_statuses(cls, since: date | None = None) -> int:
+        """
+        Set the is_active status of users with one UPDATE (same rule as set_is_active_status).
+        Return the number of changed users.
+        :param since: date of the last refresh: only users whose membership ended since then are updated
+        (range scan on the update date). None to check all users.
+        """
+        membership_delta = timedelta(days=Periods.MEMBERSHIP)
+        is_active = cls.updated_at >= date.today() - membership_delta
+        condition = cls.is_active != is_active
+        if since:
+            condition &= (cls.updated_at >= since - membership_delta) & ~is_active
+        return cls.update(is_active=is_active).where(condition).execute()
+
+    @classmethod
+    def reserve_card_numbers(cls, nb: int) -> list[str] | NoReturn:
+        """Reserve a block of nb valid and unique card numbers (none if there are not enough left)"""
+        first = Sequence.allocate(CARD_NUMBER_SEQUENCE, cls.get_highest_card_number, nb, MAXIMAL_CARD_NUMBER)
+        return [str(number) for number in range(first, first + nb)]
 
     def save(self, *args, **kwargs) -> None:
         if not self._created_at:
             self._created_at = date.today()
-            self.card_number = self.generate_unique_card_number()
+            if not self.card_number:
+                self.card_number = self.generate_unique_card_number()
             self.membership_end = self._created_at + timedelta(days=Periods.MEMBERSHIP)
             self.updated_at = date.today()
         self.last_name = str(self.last_name).upper()
@@ -0,0 +1,76 @@
+"""In-memory prefix index, to complete the search prompt with titles, series and artists names"""
+from bisect import bisect_left, insort
+from collections.abc import Hashable, Iterable
+
+from gere_ta_bib.utils.constants import NB_OF_COMPLETIONS
+from gere_ta_bib.utils.text import get_normalized_words
+
+
+class PrefixIndex:
+    """
+    A sorted array of (normalized label, label), searched with bisect.
+    Labels are grouped by owner (e.g. a notice), so that they can be replaced when the owner changes.
+    >>> index = PrefixIndex()
+    >>> index.build({1: ["Les Misérables"], 2: ["Les Mis", "Le Petit Prince"]})
+    >>> index.complete("les mi")
+    ['Les Mis', 'Les Misérables']
+    >>> index.set_labels(2, ["Le Petit Nicolas"])
+    >>> index.complete("le")
+    ['Le Petit Nicolas', 'Les Misérables']
+    """
+
+    def __init__(self):
+        self.is_built = False
+        self._entries = []
+        self._labels_by_owner = {}
+
+    def build(self, labels_by_owner: dict[Hashable, Iterable[str]]) -> None:
+        """Build the whole index at once"""
+        self._labels_by_owner = {owner: [label for label in labels if label]
+                                 for owner, labels in labels_by_owner.items()}
+        self._entries = sorted((get_key(label), label)
+                               for labels in self._labels_by_owner.values() for label in labels)
+        self.is_built = True
+
+    def complete(self, prefix: str, limit: int = NB_OF_COMPLETIONS) -> list[str]:
+        """Get the labels beginning with a prefix (ignoring case, diacritics and punctuation)"""
+        key = get_key(prefix)
+        if not key:
+            return []
+        labels = []
+        i = bisect_left(self._entries, (key,))
+        while i < len(self._entries) and self._entries[i][0].startswith(key) and len(labels) < limit:
+            if self._entries[i][1] not in labels:
+                labels.append(self._entries[i][1])
+            i += 1
+        return labels
+
+    def remove(self, owner: Hashable) -> None:
+        """Remove all labels of an owner"""
+        for label in self._labels_by_owner.pop(owner, []):
+            entry = (get_key(label), label)
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def set_labels(self, owner: Hashable, labels: Iterable[str]) -> None:
+        """Replace the labels of an owner (if index is already built, otherwise it will be done when building it)"""
+        if not self.is_built:
+            return
+        self.remove(owner)
+        self._labels_by_owner[owner] = [label for label in labels if label]
+        for label in self._labels_by_owner[owner]:
+            insort(self._entries, (get_key(label), label))
+
+
+def get_key(text: str) -> str:
+    """
+    Get the normalized form of a text used to sort and compare labels (a final space is kept)
+    >>> get_key("L'Étranger ")
+    'l etranger '
+    """
+    key = " ".join(get_normalized_words(text))
+    return f"{key} " if key and text.endswith(" ") else key
+
+
+CATALOG_COMPLETIONS = PrefixIndex()
@@ -4,12 +4,47 @@ from enum import Enum
 from pathlib import Path
 
 import typer
-from peewee import SqliteDatabase
+from peewee import DatabaseProxy
 from typer.colors import YELLOW, MAGENTA
 
 # region Database
-DB_NAME = "database.db"
-DB = SqliteDatabase(DB_NAME)
+class DbProfiles:
+    """Names of the database profiles (SQLite settings, see DB_PROFILES)"""
+    SAFE = "safe"  # SQLite defaults: rollback journal, synced at each commit (a writer blocks the readers)
+    DESKS = "desks"  # several desks on one file: WAL (readers don't block the writer), synced at checkpoints
+    FAST = "fast"  # one program alone (imports, benchmarks): not synced, a power loss may corrupt the file
+
+
+DB_PROFILES = {  # SQLite pragmas of each profile (cache_size in KiB if negative, mmap_size in bytes)
+    DbProfiles.SAFE: {"journal_mode": "delete", "synchronous": "full", "cache_size": -2_000,
+                      "mmap_size": 0, "temp_store": "default", "busy_timeout": 5_000},
+    DbProfiles.DESKS: {"journal_mode": "wal", "synchronous": "normal", "cache_size": -16_000,
+                       "mmap_size": 64 * 2 ** 20, "temp_store": "memory", "busy_timeout": 10_000},
+    DbProfiles.FAST: {"journal_mode": "wal", "synchronous": "off", "cache_size": -64_000,
+                      "mmap_size": 256 * 2 ** 20, "temp_store": "memory", "busy_timeout": 10_000},
+}
+
+
+class DbEnvVars:
+    """Environment variables to choose the database (overridden by the command line options)"""
+    PATH = "GERE_TA_BIB_DB"
+    PROFILE = "GERE_TA_BIB_DB_PROFILE"
+    IN_MEMORY = "GERE_TA_BIB_DB_IN_MEMORY"
+
+
+DB = DatabaseProxy()  # bound to a database by configure_database (see utils/database.py)
+DB_PATH = Path(__file__).parent.parent.parent / "database.db"
+DB_PROFILE = DbProfiles.DESKS
+IN_MEMORY_DB = ":memory:"
+CARD_NUMBER_SEQUENCE = "card_number"
+COPY_BARCODE_SEQUENCE = "copy_barcode"
+
+
+class MaintenanceJobs:
+    """Names of the maintenance jobs (their last run date is stored in database)"""
+    OVERDUES = "overdues"
+    RESERVATIONS = "reservations"
+    MEMBERSHIPS = "memberships"
 
 
 # endregion
@@ -33,6 +68,8 @@ class StaffOtherActionsNames(Enum):
     DELETE_COPY = "Supprimer un exemplaire"
     ADD_NOTICES = "Ajouter des notices bibliographiques"
     STATS = "Consulter des statistiques"
+    BORROW_MANY = "Prêter une pile de documents"
+    RETURN_BOX = "Traiter une boîte de retours"
 
 
 STAFF_ACTIONS = {i: action.value for i, action in enumerate(StaffActionsNames, 1)}
@@ -104,6 +141,7 @@ GENRES_TO_REFS1 = {
     "Ambiance": "M amb", "Chanson française": "M fra", "Rap": "M rap", "Pop": "M pop",
 }
 
+MAXIMAL_CARD_NUMBER = 939999999  # highest card number matching ValidExpressions.CARD_NUMBER
 MAX_NB_OF_LOANS = 30
 MAX_NB_OF_RENEWALS = 1
 MAX_NB_OF_RESERVATIONS = 5
@@ -113,13 +151,40 @@ RENEWAL_NB_OF_DAYS_ADDED_TO_TODAY = 28
 
 
 # region Program settings
+class SearchEngines:
+    """Available catalog search engines"""
+    INDEX = "index"  # words index, results sorted by document type
+    FTS5 = "fts5"  # SQLite full-text search, results sorted by relevance (if FTS5 is available)
+
+
+CSV_ARTISTS_SEPARATOR = "|"  # between the artists of a notice, in the artists columns of a CSV file
+CSV_DELIMITERS = ",;\t"  # possible delimiters of the columns of a CSV file
+CSV_FALLBACK_ENCODING = "cp1252"  # of the CSV files that are not in UTF-8 (French Excel exports)
 DECORATION_CHAR = "*"
+EAN_CACHE_SIZE = 1024  # number of EANs whose notice is kept in cache (0 to disable the cache)
 EXAMPLES_NOTICES_FOLDER = "gere_ta_bib/utils/EXAMPLES_notices_to_import"
+FUZZY_MAX_CANDIDATES = 20  # similar words considered for each word of a typo-tolerant search
+FUZZY_MAX_RESULTS = 100  # notices returned by a typo-tolerant search
+FUZZY_MIN_SIMILARITY = 0.3
+IMPORT_CHUNK_SIZE = 500  # notices written per transaction during an import
+IMPORT_MAX_RECORD_SIZE = 2 ** 24  # characters of a notice in a file, beyond which it is considered invalid
+IMPORT_MAX_WORKERS = None  # processes reading the files of a folder during an import (None: one per core)
+IMPORT_PROGRESS_STEP = 1000  # notices read between two progress reports during an import
+IMPORT_QUEUE_SIZE = 2  # chunks of records read ahead of the writer, per file, during a folder import
+IMPORT_QUEUE_TIMEOUT = 1  # seconds waiting for records before checking that the worker reading them is alive
+IMPORT_READ_SIZE = 2 ** 16  # characters read at once from a notices file
 LINE_LENGTH = 75
 LOG_FORMAT = "%(levelname)s: %(message)s"
 LOGS_FOLDER_PATH = Path(__file__).parent.parent / "logs"
+MAINTENANCE_LOG_FILE = "maintenance.log"  # in LOGS_FOLDER_PATH, for the migrations and the maintenance jobs
+MAINTENANCE_LOGGER = "gere_ta_bib.maintenance"  # name of the logger of the migrations and the maintenance jobs
+NB_OF_COMPLETIONS = 10
 NB_OF_RANDOM_NOTICES = 10
+NOTICES_FILES_SUFFIXES = (".csv", ".iso", ".json", ".jsonl", ".mrc", ".xml")  # see NOTICES_FILES_READERS
 QUIT_LETTER = "Q"
+SEARCH_ENGINE = SearchEngines.INDEX
+SEARCH_INDEX_CHUNK_SIZE = 300  # rows per insert, to stay under SQLite variables limit
+SQL_BATCH_SIZE = 200  # rows per insert (or values per IN) outside the search index: up to 4 variables per row
 YES_NO = {"YES": "O", "NO": "N"}
 USER_CHOICE_COLOR = YELLOW
 STAFF_CHOICE_COLOR = MAGENTA
@@ -0,0 +1,50 @@
+"""Database settings: database the models are bound to, and its profile (SQLite pragmas)"""
+import os
+import sqlite3
+from pathlib import Path
+from typing import NoReturn
+
+from peewee import SqliteDatabase
+
+from gere_ta_bib.utils.constants import DB, DB_PATH, DB_PROFILE, DB_PROFILES, DbEnvVars, IN_MEMORY_DB
+from gere_ta_bib.utils.exceptions import ValidationError
+
+
+def configure_database(path: str | Path | None = None, profile: str | None = None,
+                       in_memory: bool = False) -> None | NoReturn:
+    """
+    Bind the models to the database file at path, with the SQLite settings of a profile (see DB_PROFILES).
+    By default, the file and the profile are given by environment variables (see DbEnvVars),
+    else the project database (whatever the working directory) with DB_PROFILE.
+    If in_memory is True, the file is loaded in memory with the SQLite backup API: faster for read-heavy
+    sessions and benchmarks, but changes are lost when the program ends.
+    The previous database is closed.
+    """
+    path = path or os.environ.get(DbEnvVars.PATH) or DB_PATH
+    profile = profile or os.environ.get(DbEnvVars.PROFILE) or DB_PROFILE
+    if profile not in DB_PROFILES:
+        raise ValidationError(f"Profil de base de données inconnu: {profile} "
+                              f"(profils disponibles: {", ".join(DB_PROFILES)}).")
+    if DB.obj is not None:
+        DB.obj.close()
+    if not in_memory:
+        DB.initialize(SqliteDatabase(str(path), pragmas=DB_PROFILES[profile]))
+        return
+    # A database in memory is private to its connection: it is shared by all threads
+    database = SqliteDatabase(IN_MEMORY_DB, pragmas=DB_PROFILES[profile], thread_safe=False,
+                              check_same_thread=False)
+    source = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        source.backup(database.connection())
+    finally:
+        source.close()
+    DB.initialize(database)
+
+
+def is_in_memory_database() -> bool:
+    """True if the models are bound to a database in memory, False otherwise"""
+    return DB.obj is not None and DB.obj.database == IN_MEMORY_DB
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,274 @@
+"""
+Streaming readers of notices files: records are read one by one, so that memory doesn't depend on the file size.
+Readers yield records (dicts shaped like the JSON files of EXAMPLES_NOTICES_FOLDER), or the error of a record
+that can't be read. They are called with the file and the key of the artists in the records
+("authors", "directors" or "musicians"). To read a new format, add its reader to NOTICES_FILES_READERS
+and its suffix to NOTICES_FILES_SUFFIXES.
+"""
+import codecs
+import csv
+import json
+import re
+from itertools import chain
+from pathlib import Path
+from typing import Iterator, NoReturn
+from xml.etree import ElementTree
+
+from gere_ta_bib.utils.constants import CSV_ARTISTS_SEPARATOR, CSV_DELIMITERS, CSV_FALLBACK_ENCODING, \
+    IMPORT_MAX_RECORD_SIZE, IMPORT_READ_SIZE
+from gere_ta_bib.utils.exceptions import ValidationError
+
+ARTISTS_KEYS = ("last_name", "first_name", "birth_year", "death_year")  # keys of an artist in records
+INTEGERS_KEYS = ("series_volume", "birth_year", "death_year")
+ISO2709_END_OF_FIELD, ISO2709_END_OF_RECORD, ISO2709_SUBFIELD = b"\x1e", b"\x1d", b"\x1f"
+MARC_ARTISTS_TAGS = ("700", "701", "702")  # UNIMARC persons: main, alternative and secondary responsibility
+NUMBER = re.compile(r"\d+")
+WHITESPACES = re.compile(r"\s*")
+YEAR = re.compile(r"\d{4}")
+
+
+def to_integer(value: str | None) -> int | None | NoReturn:
+    """Integer from a text (None if empty), raise a ValidationError if it is not a number"""
+    if not value or not value.strip():
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"'{value}' n'est pas un nombre.")
+
+
+def get_csv_encoding(file: str | Path) -> str:
+    """
+    Guess the encoding of a CSV file from its first IMPORT_READ_SIZE bytes: UTF-8 (with or without BOM)
+    if they can be decoded as such, else CSV_FALLBACK_ENCODING (the encoding of French Excel exports)
+    """
+    with open(file, "rb") as f:
+        sample = f.read(IMPORT_READ_SIZE)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return CSV_FALLBACK_ENCODING
+
+
+def read_csv(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """
+    Read the rows of a CSV file one by one, with a header row. The delimiter is guessed among CSV_DELIMITERS,
+    quotes follow the Excel conventions (RFC 4180), and the encoding is guessed by get_csv_encoding.
+    The columns are named as the keys of the JSON files (ean, title, publisher...), and the artists are in
+    the columns last_name, first_name, birth_year and death_year: the values of several artists are separated
+    by CSV_ARTISTS_SEPARATOR, in the same order in each column.
+    """
+    with open(file, "r", encoding=get_csv_encoding(file), newline="") as f:
+        header = f.readline()
+        try:
+            delimiter = csv.Sniffer().sniff(header, CSV_DELIMITERS).delimiter
+        except csv.Error:
+            raise ValidationError(f"{file}: séparateur de colonnes introuvable dans la première ligne.")
+        rows = csv.DictReader(chain([header], f), delimiter=delimiter)
+        for row in rows:
+            try:
+                record = {key: (value or "").strip() or None for key, value in row.items()
+                          if isinstance(key, str) and key not in ARTISTS_KEYS}
+                record["series_volume"] = to_integer(record.get("series_volume"))
+                artists_values = {key: (row.get(key) or "").split(CSV_ARTISTS_SEPARATOR) for key in ARTISTS_KEYS}
+                record[artists_field] = []
+                for i in range(len(artists_values["last_name"]) if row.get("last_name") else 0):
+                    artist = {key: values[i].strip() if i < len(values) else ""
+                              for key, values in artists_values.items()}
+                    record[artists_field].append({key: to_integer(value) if key in INTEGERS_KEYS else value or None
+                                                  for key, value in artist.items()})
+                yield record
+            except ValidationError as e:
+                yield ValidationError(f"{file}, ligne {rows.line_num}: {e}")
+
+
+def get_marc_subfield(fields: list[tuple[str, list[tuple[str, str]]]], tags: tuple[str, ...],
+                      code: str) -> str | None:
+    """Get the first value of a subfield, in the first field with one of the tags (in the order of the tags)"""
+    for tag in tags:
+        for field_tag, subfields in fields:
+            if field_tag == tag:
+                for subfield_code, value in subfields:
+                    if subfield_code == code and value.strip():
+                        return value.strip()
+    return None
+
+
+def marc_to_record(fields: list[tuple[str, list[tuple[str, str]]]], artists_field: str) -> dict:
+    """
+    Get a record from the data fields of a UNIMARC notice, as (tag, [(code, value), ...]) tuples:
+    EAN in 073$a (or ISBN-13 in 010$a), title in 200$a, publisher in 210$c (or 214$c), series name and volume
+    in 225$a and $v, genre in 608$a, and artists in 700, 701 and 702 ($a last name, $b first name, $f dates).
+    """
+    isbn = (get_marc_subfield(fields, ("010",), "a") or "").replace("-", "").replace(" ", "")
+    volume = NUMBER.search(get_marc_subfield(fields, ("225",), "v") or "")
+    artists = []
+    for tag, subfields in fields:
+        if tag in MARC_ARTISTS_TAGS:
+            values = {}
+            for code, value in subfields:
+                values.setdefault(code, value.strip())
+            birth, _, death = values.get("f", "").partition("-")
+            birth_year, death_year = YEAR.search(birth), YEAR.search(death)
+            artists.append({"last_name": values.get("a") or None,
+                            "first_name": values.get("b") or None,
+                            "birth_year": int(birth_year.group()) if birth_year else None,
+                            "death_year": int(death_year.group()) if death_year else None})
+    return {"ean": get_marc_subfield(fields, ("073",), "a") or (isbn if len(isbn) == 13 else None),
+            "title": get_marc_subfield(fields, ("200",), "a"),
+            "series_name": get_marc_subfield(fields, ("225",), "a"),
+            "series_volume": int(volume.group()) if volume else None,
+            "genre": get_marc_subfield(fields, ("608",), "a"),
+            "publisher": get_marc_subfield(fields, ("210", "214"), "c"),
+            artists_field: artists}
+
+
+def parse_iso2709_record(data: bytes) -> list[tuple[str, list[tuple[str, str]]]] | NoReturn:
+    """
+    Get the data fields of an ISO 2709 notice (encoded in UTF-8), as (tag, [(code, value), ...]) tuples,
+    from its directory (control fields are ignored). Raise a ValueError if the notice is invalid.
+    """
+    if len(data) < 25 or not data.endswith(ISO2709_END_OF_RECORD):
+        raise ValueError("notice tronquée")
+    base_address = int(data[12:17])
+    directory = data[24:base_address - 1]
+    fields = []
+    for i in range(0, len(directory) - len(directory) % 12, 12):
+        tag = directory[i:i + 3].decode("ascii")
+        length, start = int(directory[i + 3:i + 7]), base_address + int(directory[i + 7:i + 12])
+        if tag < "010":  # control fields, without subfields
+            continue
+        content = data[start:start + length].rstrip(ISO2709_END_OF_FIELD)
+        fields.append((tag, [(subfield[:1].decode("utf-8"), subfield[1:].decode("utf-8"))
+                             for subfield in content.split(ISO2709_SUBFIELD)[1:] if subfield]))
+    return fields
+
+
+def read_iso2709(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """
+    Read the notices of an ISO 2709 file (UNIMARC, encoded in UTF-8) one by one, each one from its length
+    (first 5 characters of its leader). Raise a ValidationError if a length is invalid (next notices can't be found).
+    """
+    with open(file, "rb") as f:
+        nb_of_records = 0
+        while True:
+            length = f.read(5)
+            while length[:1].isspace():  # line breaks between notices
+                length = length[1:] + f.read(1)
+            if not length:
+                return
+            nb_of_records += 1
+            if not length.isdigit() or int(length) <= 24:
+                raise ValidationError(f"{file}, notice {nb_of_records}: longueur de notice invalide ({length!r}).")
+            try:
+                yield marc_to_record(parse_iso2709_record(length + f.read(int(length) - 5)), artists_field)
+            except ValueError as e:
+                yield ValidationError(f"{file}, notice {nb_of_records}: notice ISO 2709 invalide ({e}).")
+
+
+def get_xml_name(element: ElementTree.Element) -> str:
+    """Name of an XML element, without its namespace"""
+    return element.tag.rpartition("}")[2]
+
+
+def read_marcxml(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """
+    Read the notices of a MARCXML file (UNIMARC) one by one: each one is removed from the XML tree once read.
+    Raise a ValidationError if the file is not valid XML (notices already read have been yielded).
+    """
+    try:
+        elements = ElementTree.iterparse(file, events=("start", "end"))
+        _, root = next(elements)
+        for event, element in elements:
+            if event == "end" and get_xml_name(element) == "record":
+                yield marc_to_record([(field.get("tag", ""), [(subfield.get("code", ""), subfield.text or "")
+                                                              for subfield in field
+                                                              if get_xml_name(subfield) == "subfield"])
+                                      for field in element if get_xml_name(field) == "datafield"], artists_field)
+                root.clear()
+    except ElementTree.ParseError as e:
+        raise ValidationError(f"{file}: XML invalide, {e}.")
+
+
+def read_json_array(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """
+    Read the items of the top-level JSON array of a file one by one. At least IMPORT_READ_SIZE characters
+    are kept in memory ahead of the current item (more for an item larger than that, up to IMPORT_MAX_RECORD_SIZE).
+    Raise a ValidationError if the file is not a valid JSON array (items already read have been yielded).
+    """
+    decoder = json.JSONDecoder()
+    with open(file, "r", encoding="utf-8") as f:
+        buffer, position, nb_of_dropped_chars, is_eof = "", 0, 0, False
+        expected = "["  # then "item or ]" after "[", ", or ]" after an item, "item" after ","
+        while True:
+            if not is_eof and len(buffer) - position < IMPORT_READ_SIZE:
+                chunk = f.read(IMPORT_READ_SIZE)
+                is_eof = not chunk
+                nb_of_dropped_chars += position
+                buffer, position = buffer[position:] + chunk, 0
+            position = WHITESPACES.match(buffer, position).end()
+            if position == len(buffer):
+                if is_eof:
+                    raise ValidationError(f"{file}: fin de fichier inattendue.")
+                continue
+            char = buffer[position]
+            if expected == "[":
+                if char != "[":
+                    raise ValidationError(f"{file}: ce fichier ne contient pas une liste JSON de notices.")
+                position, expected = position + 1, "item or ]"
+            elif char == "]" and expected != "item":
+                return
+            elif expected == ", or ]":
+                if char != ",":
+                    raise ValidationError(f"{file}: ',' ou ']' attendu (caractère {nb_of_dropped_chars + position}).")
+                position, expected = position + 1, "item"
+            else:
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    if not is_eof and len(buffer) - position < IMPORT_MAX_RECORD_SIZE:  # item not entirely read yet
+                        chunk = f.read(len(buffer))
+                        is_eof = not chunk
+                        buffer += chunk
+                        continue
+                    raise ValidationError(f"{file}: JSON invalide, {e.msg} (caractère {nb_of_dropped_chars + e.pos}).")
+                expected = ", or ]"
+                yield item
+
+
+def read_json_lines(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """Read the records of a JSON Lines file (one JSON object per line) one by one. Empty lines are ignored."""
+    with open(file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield ValidationError(f"{file}, ligne {line_number}: JSON invalide, {e.msg}.")
+
+
+NOTICES_FILES_READERS = {
+    ".csv": read_csv,
+    ".iso": read_iso2709,
+    ".json": read_json_array,
+    ".jsonl": read_json_lines,
+    ".mrc": read_iso2709,
+    ".xml": read_marcxml,
+}
+
+
+def read_notices_file(file: str | Path, artists_field: str) -> Iterator[dict | Exception]:
+    """
+    Read the records of a notices file one by one, with the reader of its format (from its suffix).
+    Raise a ValidationError if the file can't be opened or decoded (records already read have been yielded).
+    """
+    try:
+        yield from NOTICES_FILES_READERS[Path(file).suffix.lower()](file, artists_field)
+    except (OSError, UnicodeDecodeError) as e:
+        raise ValidationError(f"{file}: fichier illisible ({e}).")
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,49 @@
+"""Text normalization, shared by the search engines and the controllers"""
+import unicodedata
+
+
+def get_normalized_words(text: str) -> list:
+    """
+    Convert to lowercase, remove diacritical marks and replace punctuation marks by spaces,
+    then return a list with normalized words.
+    >>> get_normalized_words("L'école à la plage, c'est une bonne idée !")
+    ['l', 'ecole', 'a', 'la', 'plage', 'c', 'est', 'une', 'bonne', 'idee']
+    """
+    text = remove_diacritical_marks(text.lower())
+    return "".join(char if char.isalnum() else " " for char in text).split()
+
+
+def get_trigrams(word: str) -> set[str]:
+    """
+    Get the set of trigrams of a word, padded with spaces to give more weight to its beginning
+    >>> sorted(get_trigrams("hugo"))
+    ['  h', ' hu', 'go ', 'hug', 'ugo']
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_trigrams_similarity(word: str, other_word: str) -> float:
+    """
+    Get the similarity of two words, between 0 and 1 (number of shared trigrams / number of trigrams)
+    >>> get_trigrams_similarity("hugo", "hugo")
+    1.0
+    >>> round(get_trigrams_similarity("victr", "victor"), 2)
+    0.44
+    """
+    trigrams, other_trigrams = get_trigrams(word), get_trigrams(other_word)
+    return len(trigrams & other_trigrams) / len(trigrams | other_trigrams)
+
+
+def remove_diacritical_marks(text: str) -> str:
+    """
+    Remove all diacritical marks from a string
+    >>> remove_diacritical_marks("Éàçèï oôö")
+    'Eacei ooo'
+    """
+    text = unicodedata.normalize("NFD", text)
+    return "".join(char for char in text if unicodedata.category(char) != "Mn")
+
+
+if __name__ == '__main__':
+    pass
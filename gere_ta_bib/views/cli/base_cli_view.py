@@ -10,9 +10,16 @@ import typer
 from gere_ta_bib.models.copies import BaseCopy
 from gere_ta_bib.models.notices import BaseNotice
 from gere_ta_bib.models.reservation import Reservation
+from gere_ta_bib.models.transaction import BorrowedCopy
 from gere_ta_bib.models.users import User
+from gere_ta_bib.utils.completion import CATALOG_COMPLETIONS
 from gere_ta_bib.utils.constants import ReservationStatuses, QUIT_LETTER, YES_NO
 
+try:
+    import readline
+except ImportError:  # not available on Windows: no completion in the search prompt
+    readline = None
+
 setlocale(LC_TIME, "fr_FR.UTF-8")
 
 
@@ -31,6 +38,7 @@ class BaseCliView(ABC):
         INVALID_CHOICE = "Choix invalide, choisissez un des nombres proposés."
         INVALID_DOC_BARCODE = "Ce code-barres est invalide."
         INVALID_EAN = "Code_barres commercial invalide."
+        MAINTENANCE_JOB_FAILED = "Échec de la maintenance '{job}': {error}"
         MAX_NB_OF_LOANS = ""
         MAX_NB_OF_RESERVATIONS = ""
         MULTIPLE_COPY_BARCODE = "Ce code-barres exemplaire apparaît dans plusieurs tables."
@@ -48,10 +56,13 @@ class BaseCliView(ABC):
     class InfoMessages:
         """All info messages are here"""
         ACTIONS = ""
+        APPROXIMATE_SEARCH_RESULTS = "Aucun résultat exact. Voici les résultats approchants:"
         BORROW_CONFIRMATION = "Prêt de '{}' enregistré."
         BORROWED_COPY = "{num} - {copy}\n\t--> Date d'échéance: {due_date}{overdue}"
         BORROWED = ""
         CONNEXION_CONFIRMATION = ""
+        MAINTENANCE_JOB_ALREADY_DONE = "Maintenance '{job}' déjà effectuée aujourd'hui."
+        MAINTENANCE_JOB_DONE = "Maintenance '{job}': {nb} ligne(s) mise(s) à jour en {duration:.3f} s."
         NO_SEARCH_RESULTS = "Aucun résultat..."
         NO_BORROWED = ""
         NO_RESERVATIONS = ""
@@ -103,7 +114,7 @@ class BaseCliView(ABC):
         """Display a confirmation message for document return"""
         print(BaseCliView.InfoMessages.BORROW_CONFIRMATION.format(copy))
 
-    def borrowed_copies(self, borrowed: dict[BaseCopy, datetime.date]) -> None:
+    def borrowed_copies(self, borrowed: dict[BorrowedCopy, datetime.date]) -> None:
         """Display a message with the list of all borrowed documents"""
         overdues = [copy for copy in borrowed if borrowed[copy] < datetime.date.today()]
         if borrowed:
@@ -120,6 +131,12 @@ class BaseCliView(ABC):
         """Display a message saying it's impossible to renew a document borrowed the same day"""
         print(BaseCliView.ErrorMessages.BORROWED_TODAY)
 
+    @staticmethod
+    def complete_search(text: str, state: int) -> str | None:
+        """Readline completer: return the state-th completion of the search prompt"""
+        completions = CATALOG_COMPLETIONS.complete(text)
+        return completions[state] if state < len(completions) else None
+
     def current_reservations(self, reservations: list[Reservation]) -> None:
         """Display a message with the list of all current reservations (pending or available)"""
         available_reservations = [reservation for reservation in reservations
@@ -254,8 +271,18 @@ class BaseCliView(ABC):
         return input(BaseCliView.PromptMessages.RESERVE_AGAIN)
 
     def prompt_search(self) -> str:
-        """Ask user for a query"""
-        return input(BaseCliView.PromptMessages.SEARCH.format(self.quit_letter))
+        """Ask user for a query (titles, series and artists names can be completed with Tab key)"""
+        if readline is None:
+            return input(BaseCliView.PromptMessages.SEARCH.format(self.quit_letter))
+        previous_completer, previous_delims = readline.get_completer(), readline.get_completer_delims()
+        readline.set_completer(self.complete_search)
+        readline.set_completer_delims("")
+        readline.parse_and_bind("tab: complete")
+        try:
+            return input(BaseCliView.PromptMessages.SEARCH.format(self.quit_letter))
+        finally:
+            readline.set_completer(previous_completer)
+            readline.set_completer_delims(previous_delims)
 
     def prompt_card_number(self) -> str:
         """Ask user his/her library card number"""
@@ -299,10 +326,11 @@ class BaseCliView(ABC):
         """Display a message when user tries to borrow a document he/she has returned the same day"""
         pass
 
-    def search_results(self, results: list[BaseNotice]):
-        """Display a message with search results"""
+    def search_results(self, results: list[BaseNotice], approximate: bool = False):
+        """Display a message with search results (exact or approximate ones)"""
         if results:
-            print(BaseCliView.InfoMessages.SEARCH_RESULTS)
+            print(BaseCliView.InfoMessages.APPROXIMATE_SEARCH_RESULTS if approximate
+                  else BaseCliView.InfoMessages.SEARCH_RESULTS)
             print("\n".join(BaseCliView.InfoMessages.SEARCH_RESULT.format(
                 num=typer.style(i, fg=self.choice_color), result=str(result))
                             for i, result in enumerate(results, 1)))
@@ -6,6 +6,8 @@ from typer.colors import RED
 
 from gere_ta_bib.models.copies import BaseCopy
 from gere_ta_bib.models.notices import BaseNotice
+from gere_ta_bib.models.reservation import Reservation
+from gere_ta_bib.models.transaction import BorrowedCopy
 from gere_ta_bib.models.users import User
 from gere_ta_bib.utils.constants import (DECORATION_CHAR, LINE_LENGTH, YES_NO, QUIT_LETTER,
                                          STAFF_ACTIONS, STAFF_CHOICE_COLOR, STAFF_OTHER_ACTIONS,
@@ -23,14 +25,16 @@ class StaffCliView(BaseCliView):
         """All error messages are here"""
         ALREADY_BORROWED_BY_SELF = "Ce document est déjà emprunté par la personne."
         ALREADY_RESERVED_BY_SELF = "Cette personne a déjà une réservation en cours pour ce document."
+        BORROW_MANY_ERROR = "- Document n°{barcode}: {error}"
         INVALID_NAME = "Saisie invalide: seules les lettres, l'espace et le tiret '-' sont valides."
         INVALID_YEAR = ("Saisie invalide: écrivez l'année de votre choix "
                         "entre 2000 et aujourd'hui au format: 20XX.")
         MAX_NB_OF_RESERVATIONS = "Nombre maximal de réservations atteint."
         NOT_ACTIVE_USER = "Abonnement arrivé à échéance."
         NOT_EXISTING_PATH = "Le chemin '{}' n'existe pas."
-        NOT_JSON_FILE = "Ce fichier n'est pas un fichier json..."
-        NOT_JSON_FOLDER = "Ce dossier ne contient aucun fichier json..."
+        NOT_JSON_FILE = "Ce fichier n'est pas un fichier de notices (.json, .jsonl, .csv, .xml, .mrc ou .iso)..."
+        NOT_JSON_FOLDER = "Ce dossier ne contient aucun fichier de notices (.json, .jsonl, .csv, .xml, .mrc ou .iso)..."
+        RETURN_BOX_ERROR = "- Document n°{barcode}: {error}"
 
     class InfoMessages:
         """All info messages are here"""
@@ -47,11 +51,18 @@ class StaffCliView(BaseCliView):
             f"{typer.style(num, fg=STAFF_CHOICE_COLOR)}: {action}" for num, action in STAFF_OTHER_ACTIONS.items())
         ALREADY_EXISTING_USER = "{user} est déjà inscrit, son numéro de carte est: {card_number}."
         ALREADY_EXISTING_NOTICE = "Le {notice_type} '{notice}' existe déjà dans la base."
+        BORROW_MANY_BORROWED = "- {copy}: prêt enregistré."
+        BORROW_MANY_END = "{nb_borrowed} prêt(s) enregistré(s) sur {nb} document(s):"
         BORROWED = "Emprunts actuels ({} retard):"
         CONNEXION_CONFIRMATION = "Compte de {}"
         DELETE_COPY_CONFIRMATION = "L'exemplaire '{copy}' a bien été supprimé."
         DELETE_NOTICE_CONFIRMATION = "La notice '{notice}' a bien été supprimée."
+        FILE_ALREADY_IMPORTED = "{file}: fichier déjà importé (même contenu), ignoré."
+        FILE_IMPORTED = "{file}: {nb_new} ajoutée(s), {nb_existing} existante(s), {nb_errors} erreur(s)."
+        IMPORT_PROGRESS = ("{nb_read} notices lues: {nb_new} ajoutée(s), {nb_existing} existante(s), "
+                           "{nb_errors} erreur(s)...")
         NOTICE_ADDED = "Ajout du {notice_type} '{notice}'."
+        NOTICE_TO_CHECK = "Notice {ean} à vérifier: {problems}."
         NOTICES_ADDED_END = ("Fin de l'opération de récupération des notices:\n"
                              "-> {nb_new_notices} ajoutée{s1}\n"
                              "-> {nb_existing_notices} existai{ent} déjà\n"
@@ -59,6 +70,16 @@ class StaffCliView(BaseCliView):
                              "Pour plus de détails, voir le fichier de log, qui sera généré "
                              f"{typer.style("à l'arrêt du programme", fg="yellow")} "
                              "dans le dossier geretabib/logs.")
+        NOTICES_DRY_RUN_END = ("Fin de la simulation (rien n'a été enregistré):\n"
+                               "-> {nb_read} notices lues en {duration:.1f} s ({rate:.0f} notices par seconde)\n"
+                               "-> {nb_new} seraient ajoutées, avec {nb_new_artists} nouveaux artistes "
+                               "et {nb_new_publishers} nouvelles maisons d'édition\n"
+                               "-> {nb_existing} existent déjà\n"
+                               "-> {nb_errors} erreurs (notices qui seraient refusées)\n"
+                               "-> {nb_to_check} notices à vérifier (EAN, noms ou genre non conformes)\n"
+                               "Pour plus de détails, voir le fichier de log, qui sera généré "
+                               f"{typer.style("à l'arrêt du programme", fg="yellow")} "
+                               "dans le dossier geretabib/logs.")
         NEW_COPY_CREATED_CONFIRMATION = ("Un nouvel exemplaire de {notice} a été créé.\n"
                                          "Son code-barres ewxemplaire est: {barcode}.")
         NEW_USER_CREATED_CONFIRMATION = ("L'inscriuption de {first_name} {last_name} a bien été réalisée!\n"
@@ -67,10 +88,16 @@ class StaffCliView(BaseCliView):
         NO_RESERVATIONS = "Aucune réservation en cours."
         NO_USER_FOUND = "Personne ne correspond à cette recherche..."
         NOTICES_TO_ADD = ("Pour importer des notices, vous devez fournir un fichier (ou un dossier de fichiers) \n"
-                          "au format json, contruit comme dans les modèles à cet emplacement:\n"
-                          f"'{EXAMPLES_NOTICES_FOLDER}'.")
+                          "au format json (ou json lines: une notice par ligne, extension .jsonl) ou csv, \n"
+                          "contruit comme dans les modèles à cet emplacement:\n"
+                          f"'{EXAMPLES_NOTICES_FOLDER}'.\n"
+                          "Les notices UNIMARC sont aussi acceptées, en MARCXML (.xml) ou ISO 2709 (.mrc ou .iso).")
         RESERVED_NOTICES = "Réservations en cours (dont {nb} disponible{s}):"
         RETURN_A_RESERVED_DOCUMENT = "Ce document est réservé par {}."
+        RETURN_BOX_END = "{nb_returned} retour(s) enregistré(s) sur {nb} document(s)."
+        RETURN_BOX_HOLD = "- {notice} (n°{barcode}): réservé par {user}"
+        RETURN_BOX_HOLDS = "À mettre de côté pour les réservations ({nb}):"
+        RETURN_BOX_NO_HOLDS = "Aucun document à mettre de côté pour une réservation."
         USER_FOUND = "{num}: {user}"
         USERS_FOUND = "Les personnes inscrites correspondant à votre recherche sont:"
         USER_UPDATED_CONFIRMATION = ("Le compte de {user} a été mis à jour.\n"
@@ -83,6 +110,8 @@ class StaffCliView(BaseCliView):
         BACK_TO_MAIN_MENU = f"('{typer.style(QUIT_LETTER, fg=STAFF_CHOICE_COLOR)}' pour revenir au menu principal)"
         CHOICE = f"('{typer.style(QUIT_LETTER, fg=STAFF_CHOICE_COLOR)}' pour quitter) Votre choix ? "
         CHOICE_OTHER = f"{BACK_TO_MAIN_MENU} Votre choix ? "
+        COPIES_BARCODES = (f"{BACK_TO_MENU} Scannez les documents l'un après l'autre, "
+                           "puis appuyez sur 'Entrée' sur une ligne vide pour enregistrer les prêts:")
         DELETE_COPY = f"{BACK_TO_MENU} Code-barres de l'exemplaire à supprimer: "
         DELETE_COPY_CONFIRM = ("Vous allez supprimer {copy}.\n"
                                f"Confirmez-vous la suppression ? [{YES_NO["YES"].lower()}/{YES_NO["NO"].upper()}] ")
@@ -103,12 +132,17 @@ class StaffCliView(BaseCliView):
                             f"Confirmez-vous ? [{YES_NO["YES"].upper()}/{YES_NO["NO"].lower()}] ")
         NEW_USER_FIRST_NAME = f"{BACK_TO_MENU} Prénom: "
         NEW_USER_LAST_NAME = f"{BACK_TO_MENU} Nom de famille: "
-        NOTICES_FILE_PATH = (f"{BACK_TO_MENU}\nIndiquez l'emplacement absolu du fichier json "
-                             "(ou du dossier contenant des fichiers json):\n")
+        NOTICES_FILE_PATH = (f"{BACK_TO_MENU}\nIndiquez l'emplacement absolu du fichier de notices "
+                             "(ou du dossier contenant des fichiers de notices):\n")
+        NOTICES_DRY_RUN = ("Voulez-vous seulement simuler l'import (vérifier les notices sans rien enregistrer) ? "
+                           f"[{YES_NO["YES"].lower()}/{YES_NO["NO"].upper()}] ")
         NOTICES_TYPE_TO_ADD = (f"{BACK_TO_MENU} Quel type de notices voulez-vous ajouter ?\n"
                                f"{'\n'.join(f"{typer.style(i, fg=STAFF_CHOICE_COLOR)}: {type}"
                                             for i, type in enumerate(DOC_TYPES_NAMES, 1))}\n"
                                "Votre choix ? ")
+        RETURN_BOX = (f"{BACK_TO_MENU} Scannez les documents l'un après l'autre "
+                      "(ou indiquez l'emplacement d'un fichier de codes-barres),\n"
+                      "puis appuyez sur 'Entrée' sur une ligne vide pour enregistrer les retours:")
         RETURNED_TODAY = ("Document rendu ce jour par la personne.\n"
                           "Faire tout de même un nouvel emprunt ? "
                           f"[{YES_NO["YES"].lower()}/{YES_NO["NO"].upper()}] ")
@@ -125,6 +159,17 @@ class StaffCliView(BaseCliView):
         """Display a message to say that a user is already existing ion the database"""
         print(self.InfoMessages.ALREADY_EXISTING_USER.format(user=user, card_number=user.card_number))
 
+    def borrow_many_report(self, outcomes: dict[str, Exception | None], borrowed: list[BorrowedCopy]) -> None:
+        """Display the outcome of each document of a stack of loans"""
+        borrowed_by_barcode = {copy.barcode: copy for copy in borrowed}
+        nb_borrowed = sum(error is None for error in outcomes.values())
+        print(self.InfoMessages.BORROW_MANY_END.format(nb_borrowed=nb_borrowed, nb=len(outcomes)))
+        for barcode, error in outcomes.items():
+            if error is None:
+                print(self.InfoMessages.BORROW_MANY_BORROWED.format(copy=borrowed_by_barcode.get(barcode, barcode)))
+            else:
+                print(self.ErrorMessages.BORROW_MANY_ERROR.format(barcode=barcode, error=error))
+
     def delete_copy_confirm(self, copy: BaseCopy) -> None:
         """Display a message to confirm that a copy was deleted"""
         print(self.InfoMessages.DELETE_COPY_CONFIRMATION.format(copy=copy))
@@ -170,8 +215,31 @@ class StaffCliView(BaseCliView):
                                                          nb_errors=nb_errors,
                                                          s2="s" if nb_errors > 1 else ""))
 
+    def file_already_imported(self, file: str) -> None:
+        """Say that a file is skipped, because it has already been imported"""
+        print(self.InfoMessages.FILE_ALREADY_IMPORTED.format(file=file))
+
+    def file_imported(self, file: str, nb_new: int, nb_existing: int, nb_errors: int) -> None:
+        """Display the numbers of notices of a file, at the end of a folder import"""
+        print(self.InfoMessages.FILE_IMPORTED.format(file=file, nb_new=nb_new, nb_existing=nb_existing,
+                                                     nb_errors=nb_errors))
+
+    def import_progress(self, nb_read: int, nb_new: int, nb_existing: int, nb_errors: int) -> None:
+        """Display the progress of an import"""
+        print(self.InfoMessages.IMPORT_PROGRESS.format(nb_read=nb_read, nb_new=nb_new, nb_existing=nb_existing,
+                                                       nb_errors=nb_errors))
+
+    def notices_dry_run_end(self, nb_read: int, nb_new: int, nb_existing: int, nb_errors: int, nb_to_check: int,
+                            nb_new_artists: int, nb_new_publishers: int, duration: float) -> None:
+        """Display the numbers of an import dry run (see DryRunReport), and its throughput"""
+        print(self.InfoMessages.NOTICES_DRY_RUN_END.format(nb_read=nb_read, nb_new=nb_new, nb_existing=nb_existing,
+                                                           nb_errors=nb_errors, nb_to_check=nb_to_check,
+                                                           nb_new_artists=nb_new_artists,
+                                                           nb_new_publishers=nb_new_publishers, duration=duration,
+                                                           rate=nb_read / duration if duration else 0))
+
     def notices_to_add_info(self) -> None:
-        """Say where to find example json notices files to import"""
+        """Say where to find example notices files to import, and which formats are accepted"""
         print(typer.style(self.InfoMessages.NOTICES_TO_ADD, fg="yellow"))
 
     def new_copy_created(self, notice: BaseNotice, barcode: str) -> None:
@@ -191,11 +259,11 @@ class StaffCliView(BaseCliView):
         print(self.ErrorMessages.NOT_EXISTING_PATH.format(path))
 
     def not_json_file(self, file_path: str) -> None:
-        """Display a message if file is not a json file"""
+        """Display a message if file is not a notices file (see NOTICES_FILES_SUFFIXES)"""
         print(self.ErrorMessages.NOT_JSON_FILE)
 
     def not_json_folder(self, folder_path: str) -> None:
-        """Display a message if folder doesn't contain any json file"""
+        """Display a message if folder doesn't contain any notices file (see NOTICES_FILES_SUFFIXES)"""
         print(self.ErrorMessages.NOT_JSON_FOLDER)
 
     def prompt_choice(self) -> str:
@@ -206,6 +274,20 @@ class StaffCliView(BaseCliView):
         """Ask staff member what he/she wants to do in the secondary menu"""
         return input(self.PromptMessages.CHOICE_OTHER)
 
+    def prompt_copies_barcodes(self, message: str = PromptMessages.COPIES_BARCODES) -> list[str]:
+        """Ask the barcodes of several copies (one per line, until an empty line), empty list to go back to menu"""
+        print(message)
+        barcodes = []
+        while barcode := input().strip():
+            if barcode.upper() == QUIT_LETTER:
+                return []
+            barcodes.append(barcode)
+        return barcodes
+
+    def prompt_return_box_barcodes(self) -> list[str]:
+        """Ask the barcodes of the copies of a return box (or the path of a file with these barcodes)"""
+        return self.prompt_copies_barcodes(self.PromptMessages.RETURN_BOX)
+
     def prompt_delete_copy(self) -> str:
         """Ask the barcode of the copy to delete"""
         return input(self.PromptMessages.DELETE_COPY)
@@ -238,8 +320,12 @@ class StaffCliView(BaseCliView):
         """Ask the EAN of the notice to create a new copy"""
         return input(self.PromptMessages.NEW_COPY_EAN)
 
+    def prompt_notices_dry_run(self) -> str:
+        """Ask if the import of notices must only be simulated"""
+        return input(self.PromptMessages.NOTICES_DRY_RUN)
+
     def prompt_notices_path(self) -> str:
-        """Ask for the path of the file (or folder) with notices json data to add"""
+        """Ask for the path of the file (or folder) with notices data to add"""
         return input(self.PromptMessages.NOTICES_FILE_PATH)
 
     def prompt_notices_type(self) -> str:
@@ -274,6 +360,24 @@ class StaffCliView(BaseCliView):
         """Display a warning when a reserved document is returned"""
         print(self.InfoMessages.RETURN_A_RESERVED_DOCUMENT.format(borrower))
 
+    def return_box_report(self, outcomes: dict[str, Exception | None], holds: list[tuple[str, Reservation]],
+                          users_by_card_number: dict[str, User]) -> None:
+        """Display the errors of a return box, then the documents to put on the hold shelf"""
+        nb_returned = sum(error is None for error in outcomes.values())
+        print(self.InfoMessages.RETURN_BOX_END.format(nb_returned=nb_returned, nb=len(outcomes)))
+        for barcode, error in outcomes.items():
+            if error is not None:
+                print(self.ErrorMessages.RETURN_BOX_ERROR.format(barcode=barcode, error=error))
+        print()
+        if not holds:
+            print(self.InfoMessages.RETURN_BOX_NO_HOLDS)
+            return
+        print(self.InfoMessages.RETURN_BOX_HOLDS.format(nb=len(holds)))
+        for barcode, reservation in holds:
+            print(self.InfoMessages.RETURN_BOX_HOLD.format(
+                notice=reservation.notice, barcode=barcode,
+                user=users_by_card_number.get(reservation.card_number, reservation.card_number)))
+
     def user_account_updated(self, user: User) -> None:
         """Display a message to confirm that user account has been updated,
         and to give the new date of membership ending"""